@@ -0,0 +1,56 @@
+"""URL canonicalization throughput: canonical key plus 64-bit hash per URL.
+
+Usage: python benchmarks/bench_canonicalize.py [--urls N] [--distinct N]
+
+Times a cold pass (every URL new to the canonicalizer's cache) and a warm pass over a stream with
+repeats, which is what dedup sees in practice.
+"""
+import argparse
+import os
+import pathlib
+import random
+import sys
+import time
+
+for name in ('OPENAI_API_KEY', 'LINKCURATOR_TOKEN', 'TWITTER_BEARER_TOKEN'):
+    os.environ.setdefault(name, 'benchmark')
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+
+HOSTS = ['www.example.com', 'm.youtube.com', 'x.com', 'mobile.twitter.com', 'news.example.org:443', 'EXAMPLE.net']
+QUERIES = ['', '?utm_source=feed&utm_medium=rss', '?id={i}&fbclid=abc', '?b=2&a=1', '?si=share&t=30', '?ref=home']
+
+
+def make_urls(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        f"{rng.choice(['http', 'https'])}://{rng.choice(HOSTS)}/section/{i % 97}/./post-{i}/"
+        f"{rng.choice(QUERIES).format(i=i)}{rng.choice(['', '#top'])}"
+        for i in range(count)
+    ]
+
+
+def run(urls, canonicalizer):
+    started = time.perf_counter()
+    for url in urls:
+        canonicalizer.key(url)
+    elapsed = time.perf_counter() - started
+    return len(urls) / elapsed, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--urls', type=int, default=1_000_000, help="URLs per pass")
+    parser.add_argument('--distinct', type=int, default=50_000, help="distinct URLs in the warm stream")
+    args = parser.parse_args()
+
+    cold = make_urls(args.urls)
+    rate, elapsed = run(cold, main.URLCanonicalizer())
+    print(f"cold: {len(cold):,} distinct URLs in {elapsed:.2f}s, {rate:,.0f} URLs/s")
+
+    pool = make_urls(args.distinct, seed=1)
+    rng = random.Random(2)
+    warm = [rng.choice(pool) for _ in range(args.urls)]
+    rate, elapsed = run(warm, main.URLCanonicalizer())
+    print(f"warm: {len(warm):,} URLs ({len(pool):,} distinct) in {elapsed:.2f}s, {rate:,.0f} URLs/s")
@@ -0,0 +1,89 @@
+"""Metadata extraction: the one-pass MetadataExtractor against the old BeautifulSoup html.parser path.
+
+Usage: python benchmarks/bench_metadata.py [corpus_dir] [--repeat N]
+
+corpus_dir holds saved pages (*.html); without one, synthetic pages of a few sizes are used.
+"""
+import argparse
+import os
+import pathlib
+import sys
+import time
+
+for name in ('OPENAI_API_KEY', 'LINKCURATOR_TOKEN', 'TWITTER_BEARER_TOKEN'):
+    os.environ.setdefault(name, 'benchmark')
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+
+def synthetic_page(paragraphs):
+    head = (
+        "<head><title>Synthetic page</title>"
+        '<meta name="description" content="A page for benchmarking.">'
+        '<meta property="og:title" content="Synthetic"><meta name="twitter:card" content="summary">'
+        '<link rel="canonical" href="https://example.com/page">'
+        '<script type="application/ld+json">{"@type": "Article", "headline": "Synthetic"}</script></head>'
+    )
+    body = "".join(
+        f'<div class="post"><p>Paragraph {i} with <a href="/l/{i}">a link</a> and some <b>markup</b>.</p></div>'
+        for i in range(paragraphs)
+    )
+    return f"<!DOCTYPE html><html>{head}<body><nav>menu</nav>{body}</body></html>"
+
+
+def load_corpus(directory):
+    if directory:
+        return {path.name: path.read_text(errors='replace') for path in sorted(pathlib.Path(directory).glob('*.html'))}
+    return {f"synthetic-{size}p": synthetic_page(size) for size in (10, 200, 2000)}
+
+
+def bs4_title(html):
+    # What fetch_webpage did before: build the whole tree to read one element
+    soup = BeautifulSoup(html, 'html.parser')
+    return soup.title.string if soup.title else None
+
+
+def extractor_title(html):
+    return main.extract_metadata(html).best_title
+
+
+def timed(func, html, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(html)
+    return (time.perf_counter() - started) / repeat
+
+
+def run(corpus, repeat):
+    print(f"{'page':30} {'size':>10} {'extractor':>12} {'bs4':>12} {'speedup':>8}")
+    totals = [0.0, 0.0]
+    for name, html in corpus.items():
+        extractor = timed(extractor_title, html, repeat)
+        totals[0] += extractor
+        if BeautifulSoup is None:
+            print(f"{name:30} {len(html):>10} {extractor * 1000:>10.2f}ms {'-':>12} {'-':>8}")
+            continue
+        soup = timed(bs4_title, html, repeat)
+        totals[1] += soup
+        print(f"{name:30} {len(html):>10} {extractor * 1000:>10.2f}ms {soup * 1000:>10.2f}ms {soup / extractor:>7.1f}x")
+    if BeautifulSoup is None:
+        print("beautifulsoup4 is not installed; only the extractor was timed.")
+    elif totals[0]:
+        print(f"{'total':30} {'':>10} {totals[0] * 1000:>10.2f}ms {totals[1] * 1000:>10.2f}ms {totals[1] / totals[0]:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('corpus', nargs='?', help="directory of saved *.html pages")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        sys.exit(f"No *.html files in {args.corpus}")
+    run(corpus, args.repeat)
@@ -3,14 +3,28 @@ from discord.ext import commands
 import traceback
 import sys
 import asyncio
-import openai
 import os
-from bs4 import BeautifulSoup
 import aiohttp
 import urllib.parse
 import time
 import re
+import codecs
+import contextlib
+import functools
+import hashlib
+import heapq
+import random
+from html.parser import HTMLParser
 from enum import Enum
+import dataclasses
+from dataclasses import dataclass, field
+import json
+import datetime
+import math
+from collections import Counter
+import sqlite3
+import struct
+import zlib
 import requests 
 
 class ProcessLinkResult(Enum):
@@ -18,6 +32,8 @@ class ProcessLinkResult(Enum):
     ALREADY_EXISTS = 2
     THREAD_EXISTS = 3
     PERMISSION_ERROR = 4
+    FETCH_FAILED = 5
+    NOT_FOUND = 6
 
 
 # Define the intents
@@ -30,8 +46,6 @@ openai_api_key = os.getenv('OPENAI_API_KEY')
 if openai_api_key is None:
     print("Error: OPENAI_API_KEY environment variable not set.")
     sys.exit(1)
-else:
-    openai.api_key = openai_api_key
 
 bot_token = os.getenv('LINKCURATOR_TOKEN')
 if bot_token is None:
@@ -49,54 +63,1072 @@ else:
   access_token_secret = os.getenv('TWITTER_ACCESS_TOKEN_SECRET')
 
 
+# Shared HTTP client, created in setup_hook and closed on shutdown
+HTTP_TIMEOUT = 10
+HTTP_CONNECTION_LIMIT = 100
+HTTP_CONNECTIONS_PER_HOST = 10
+HTTP_DNS_CACHE_TTL = 300
+HTTP_KEEPALIVE_TIMEOUT = 60
+# Hosts we talk to on almost every link; connections to them are opened at startup
+WARM_HOSTS = ["https://api.twitter.com", "https://api.openai.com"]
+
+http_session = None
+
+def create_http_session():
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_CONNECTION_LIMIT,
+        limit_per_host=HTTP_CONNECTIONS_PER_HOST,
+        use_dns_cache=True,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+    )
+    timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+async def warm_up_connections(session):
+    async def warm(host):
+        try:
+            async with session.head(host, allow_redirects=False) as response:
+                await response.release()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Could not pre-open connection to {host}: {e}")
+    await asyncio.gather(*(warm(host) for host in WARM_HOSTS))
+
+
+# Token-bucket rate limits per host / upstream API: (tokens per second, burst)
+DEFAULT_RATE_LIMIT = (2.0, 5)
+RATE_LIMITS = {
+    'api.twitter.com': (1.0, 3),
+    'discord.archived_threads': (0.5, 2),
+    'discord.message_delete': (1.0, 3),
+}
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.acquired = 0
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def acquire(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # Reserve a token up front; a negative balance queues callers in arrival order
+        self.tokens -= 1
+        self.acquired += 1
+        if self.tokens < 0:
+            wait = -self.tokens / self.rate
+            self.waits += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            await asyncio.sleep(wait)
+
+class RateLimiter:
+    def __init__(self, limits=RATE_LIMITS, default=DEFAULT_RATE_LIMIT):
+        self.limits = limits
+        self.default = default
+        self.buckets = {}
+
+    def bucket(self, key):
+        if key not in self.buckets:
+            self.buckets[key] = TokenBucket(*self.limits.get(key, self.default))
+        return self.buckets[key]
+
+    async def acquire(self, key):
+        await self.bucket(key).acquire()
+
+    def stats(self):
+        return {
+            key: {
+                "acquired": bucket.acquired,
+                "waits": bucket.waits,
+                "total_wait": bucket.total_wait,
+                "max_wait": bucket.max_wait,
+            }
+            for key, bucket in self.buckets.items()
+        }
+
+rate_limiter = RateLimiter()
+
+
+# Streaming HTML fetch: only read as much of a page as the metadata needs
+HEAD_FETCH_BYTES = 64 * 1024
+# Larger budget used only when the head has no description; the body text is then summarized instead
+FALLBACK_FETCH_BYTES = 512 * 1024
+FETCH_CHUNK_SIZE = 8 * 1024
+# Longest value of any one metadata field in a thread message
+METADATA_FIELD_MAX_CHARS = 300
+
+def shorten(text, limit):
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(' ', 1)[0].rstrip(',;:') + '…'
+
+@dataclass
+class PageMetadata:
+    title: str = None
+    description: str = None
+    canonical_url: str = None
+    jsonld_headline: str = None
+    og: dict = field(default_factory=dict)
+    twitter: dict = field(default_factory=dict)
+    blocks: list = field(default_factory=list)  # (text, characters inside links) per body text block
+
+    @property
+    def best_title(self):
+        return self.title or self.og.get('title') or self.twitter.get('title') or self.jsonld_headline
+
+    @property
+    def best_description(self):
+        return self.description or self.og.get('description') or self.twitter.get('description')
+
+    def as_dict(self):
+        """The fixed, bounded set of fields shown with a link."""
+        fields = {
+            "title": self.best_title,
+            "description": self.best_description,
+            "canonical": self.canonical_url,
+            "site_name": self.og.get('site_name'),
+        }
+        return {key: shorten(value, METADATA_FIELD_MAX_CHARS) for key, value in fields.items() if value}
+
+
+def find_jsonld_headline(data):
+    if isinstance(data, list):
+        for item in data:
+            headline = find_jsonld_headline(item)
+            if headline:
+                return headline
+    elif isinstance(data, dict):
+        if isinstance(data.get('headline'), str):
+            return data['headline']
+        return find_jsonld_headline(data.get('@graph'))
+    return None
+
+
+# Body text extraction, readability style: block-level text, minus navigation and other page furniture
+CONTENT_BLOCK_TAGS = {
+    'p', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'pre', 'td', 'dd', 'dt',
+    'figcaption', 'article', 'section', 'main', 'div', 'tr', 'ul', 'ol', 'table',
+}
+SKIPPED_TAGS = {
+    'script', 'style', 'noscript', 'nav', 'header', 'footer', 'aside', 'form', 'button', 'svg',
+    'select', 'template', 'iframe', 'dialog', 'menu',
+}
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+# Optional end tags: a start tag closes an open element of these kinds...
+IMPLIED_END_TAGS = {
+    'p': {'p'}, 'li': {'li'}, 'dt': {'dt', 'dd'}, 'dd': {'dt', 'dd'},
+    'tr': {'tr', 'td', 'th'}, 'td': {'td', 'th'}, 'th': {'td', 'th'},
+}
+# ...block-level start tags also close an open <p>...
+CLOSES_PARAGRAPH = {
+    'p', 'div', 'ul', 'ol', 'dl', 'table', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'pre', 'article',
+    'section', 'main', 'nav', 'header', 'footer', 'aside', 'form', 'figure', 'address', 'details', 'fieldset', 'menu',
+}
+# ...but never one outside the nearest of these containers
+IMPLIED_END_SCOPE = {'ul', 'ol', 'dl', 'table', 'div', 'article', 'section', 'main', 'blockquote', 'button'}
+# Matched against whole id/class/role tokens, so "has-sidebar" on a page wrapper is not boilerplate
+BOILERPLATE_ATTRIBUTE = re.compile(
+    r'(?:cookies?|consent|banner|navbar|nav|navigation|menu|footer|header|sidebar|share|sharing|social|comments?|'
+    r'subscribe|newsletter|promo|advert|ads?|related|breadcrumbs?|popup|modal|paywall|complementary|contentinfo)'
+    r'(?:[-_][a-z0-9]+)*',
+    re.IGNORECASE,
+)
+
+def is_boilerplate(attrs):
+    tokens = f"{attrs.get('id') or ''} {attrs.get('class') or ''} {attrs.get('role') or ''}".split()
+    return any(BOILERPLATE_ATTRIBUTE.fullmatch(token) for token in tokens)
+BOILERPLATE_TEXT = re.compile(
+    r'cookie|subscribe|sign up|sign in|log in|all rights reserved|privacy policy|terms of (?:use|service)|'
+    r'newsletter|advertisement|accept all|javascript',
+    re.IGNORECASE,
+)
+
+class MetadataExtractor(HTMLParser):
+    """Single-pass, incremental metadata extractor. Builds no DOM; feed it chunks as they arrive."""
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.metadata = PageMetadata()
+        self.head_closed = False
+        self._title_parts = None
+        self._jsonld_parts = None
+        self._open = []  # open body elements, outermost first
+        self._skip = None  # index in _open of a boilerplate element whose text is ignored
+        self._block = []
+        self._link_chars = 0
+        self._in_link = 0
+
+    @property
+    def has_description(self):
+        return bool(self.metadata.best_description)
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'script' and (dict(attrs).get('type') or '').lower() == 'application/ld+json':
+            self._jsonld_parts = []
+            return
+        if tag == 'body':
+            self.head_closed = True
+            return
+        if self.head_closed and tag not in VOID_TAGS and tag not in ('html', 'title'):
+            self._open_element(tag, dict(attrs))
+            return
+        if self._skip is not None:
+            return
+        if tag == 'title' and self.metadata.title is None:
+            self._title_parts = []
+        elif tag == 'meta':
+            self._handle_meta(dict(attrs))
+        elif tag == 'link':
+            attrs = dict(attrs)
+            if 'canonical' in (attrs.get('rel') or '').lower().split() and attrs.get('href'):
+                self.metadata.canonical_url = attrs['href'].strip()
+
+    def _open_element(self, tag, attrs):
+        closes = IMPLIED_END_TAGS.get(tag, set()) | ({'p'} if tag in CLOSES_PARAGRAPH else set())
+        if closes:
+            target = None
+            for index in range(len(self._open) - 1, -1, -1):
+                if self._open[index] in closes:
+                    target = index
+                elif self._open[index] in IMPLIED_END_SCOPE:
+                    break
+            if target is not None:
+                self._close_to(target)
+        self._open.append(tag)
+        if self._skip is not None:
+            return
+        if tag in SKIPPED_TAGS or is_boilerplate(attrs):
+            self._end_block()
+            self._skip = len(self._open) - 1
+        elif tag in CONTENT_BLOCK_TAGS:
+            self._end_block()
+        elif tag == 'a':
+            self._in_link += 1
+
+    def _close_to(self, index):
+        """Close the open element at index and everything still open inside it."""
+        while len(self._open) > index:
+            tag = self._open.pop()
+            if self._skip is not None:
+                if len(self._open) <= self._skip:
+                    self._skip = None
+            elif tag in CONTENT_BLOCK_TAGS:
+                self._end_block()
+            elif tag == 'a' and self._in_link:
+                self._in_link -= 1
+
+    def _handle_meta(self, attrs):
+        name = (attrs.get('property') or attrs.get('name') or '').strip().lower()
+        content = ' '.join((attrs.get('content') or '').split())
+        if not name or not content:
+            return
+        if name == 'description':
+            self.metadata.description = self.metadata.description or content
+        elif name.startswith('og:'):
+            self.metadata.og.setdefault(name[3:], content)
+        elif name.startswith('twitter:'):
+            self.metadata.twitter.setdefault(name[8:], content)
+
+    def handle_data(self, data):
+        if self._jsonld_parts is not None:
+            self._jsonld_parts.append(data)
+        elif self._title_parts is not None:
+            self._title_parts.append(data)
+        elif self.head_closed and self._skip is None:
+            self._block.append(data)
+            if self._in_link:
+                self._link_chars += len(data.strip())
+
+    def _end_block(self):
+        text = ' '.join(''.join(self._block).split())
+        if text:
+            self.metadata.blocks.append((text, self._link_chars))
+        self._block = []
+        self._link_chars = 0
+
+    def handle_endtag(self, tag):
+        if tag == 'script' and self._jsonld_parts is not None:
+            if self.metadata.jsonld_headline is None:
+                try:
+                    self.metadata.jsonld_headline = find_jsonld_headline(json.loads(''.join(self._jsonld_parts)))
+                except ValueError:
+                    pass
+            self._jsonld_parts = None
+        elif tag == 'head':
+            self.head_closed = True
+        elif tag == 'title' and self._title_parts is not None:
+            self.metadata.title = ' '.join(''.join(self._title_parts).split()) or None
+            self._title_parts = None
+        elif tag in self._open:
+            # Closing an element also closes anything left open inside it
+            self._close_to(len(self._open) - 1 - self._open[::-1].index(tag))
+
+    def close(self):
+        super().close()
+        self._end_block()
+
+
+# Offline token counting and budgeting for LLM input
+SUMMARY_INPUT_TOKENS = 2000
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+|(?<=[。！？])')
+
+def count_tokens(text):
+    """Approximate GPT token count without a tokenizer download: ~4 ASCII characters per word piece,
+    1 per non-ASCII character (CJK, Cyrillic, ... tokenize far less densely) and 1 per symbol."""
+    total = 0
+    for piece in TOKEN_PATTERN.findall(text):
+        if piece[0].isalnum() or piece[0] == '_':
+            wide = sum(1 for char in piece if ord(char) > 127)
+            total += wide + (len(piece) - wide + 3) // 4
+        else:
+            total += 1
+    return total
+
+def fit_to_token_budget(text, budget=SUMMARY_INPUT_TOKENS):
+    """Leading whole sentences of text that fit the budget (the first sentence is cut if it alone is too long)."""
+    if count_tokens(text) <= budget:
+        return text
+    kept = []
+    used = 0
+    for sentence in SENTENCE_END.split(text):
+        tokens = count_tokens(sentence)
+        if used + tokens > budget:
+            if not kept:
+                kept.append(sentence[:len(sentence) * budget // tokens])
+            break
+        kept.append(sentence)
+        used += tokens
+    return ' '.join(kept)
+
+def score_block(text, link_chars):
+    words = len(text.split())
+    if words < 6:
+        return 0.0
+    link_density = link_chars / len(text)
+    if link_density > 0.5:
+        return 0.0
+    score = words * (1 - link_density) + 3 * text.count(',')
+    if BOILERPLATE_TEXT.search(text):
+        score *= 0.2
+    return score
+
+def select_main_content(blocks, budget=SUMMARY_INPUT_TOKENS):
+    """The most informative body blocks that fit the token budget, in page order."""
+    scored = []
+    for index, (text, link_chars) in enumerate(blocks):
+        score = score_block(text, link_chars)
+        if score > 0:
+            scored.append((score, index, count_tokens(text)))
+    chosen = set()
+    used = 0
+    for score, index, tokens in sorted(scored, reverse=True):
+        if used + tokens <= budget:
+            chosen.add(index)
+            used += tokens
+    return '\n\n'.join(blocks[index][0] for index in sorted(chosen))
+
+
+def extract_metadata(html):
+    extractor = MetadataExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return extractor.metadata
+
+async def iter_body(response, prefix=b''):
+    """Body chunks of a response, starting with any bytes already read while sniffing."""
+    if prefix:
+        yield prefix
+    async for chunk in response.content.iter_chunked(FETCH_CHUNK_SIZE):
+        yield chunk
+
+async def read_prefix(response, size):
+    data = b''
+    while len(data) < size:
+        chunk = await response.content.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+async def read_page_metadata(response, max_bytes=HEAD_FETCH_BYTES, fallback_bytes=FALLBACK_FETCH_BYTES, prefix=b''):
+    try:
+        decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+    except LookupError:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    extractor = MetadataExtractor()
+    total = 0
+    budget = max_bytes
+    async for chunk in iter_body(response, prefix):
+        extractor.feed(decoder.decode(chunk))
+        total += len(chunk)
+        if extractor.head_closed and extractor.has_description:
+            break
+        if total >= budget:
+            if extractor.has_description or budget >= fallback_bytes:
+                break
+            budget = fallback_bytes
+    extractor.feed(decoder.decode(b'', final=True))
+    extractor.close()
+    return extractor.metadata
+
+
+# Content-type dispatch: only HTML is parsed; everything else takes a bounded fast path
+SNIFF_BYTES = 1024
+IMAGE_PROBE_BYTES = 64 * 1024
+PDF_MAX_BYTES = 2 * 1024 * 1024
+PDF_MAX_TEXT_CHARS = 4000
+# Never worth reading: answered from the response headers alone
+BINARY_CONTENT_TYPES = (
+    'video/', 'audio/', 'font/', 'model/', 'application/zip', 'application/gzip', 'application/x-tar',
+    'application/x-7z-compressed', 'application/x-rar-compressed', 'application/x-msdownload',
+    'application/vnd.android.package-archive', 'application/java-archive', 'application/x-iso9660-image',
+)
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+def is_image_signature(data):
+    return (
+        data.startswith((b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a', b'\xff\xd8\xff'))
+        or (data[:4] == b'RIFF' and data[8:12] == b'WEBP')
+    )
+
+def sniff_content_kind(content_type, head):
+    if head.startswith(b'%PDF-') or content_type == 'application/pdf':
+        return 'pdf'
+    if is_image_signature(head) or content_type.startswith('image/'):
+        return 'image'
+    if content_type in HTML_CONTENT_TYPES or content_type.startswith('text/'):
+        return 'html'
+    start = head.lstrip(b'\xef\xbb\xbf \t\r\n')[:64].lower()
+    if start.startswith((b'<!doctype html', b'<html', b'<head')):
+        return 'html'
+    return 'binary'
+
+def image_dimensions(data):
+    if data.startswith(b'\x89PNG\r\n\x1a\n') and len(data) >= 24:
+        return struct.unpack('>II', data[16:24])
+    if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+        return struct.unpack('<HH', data[6:10])
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP' and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b'VP8 ':
+            width, height = struct.unpack('<HH', data[26:30])
+            return width & 0x3fff, height & 0x3fff
+        if chunk == b'VP8L':
+            bits = int.from_bytes(data[21:25], 'little')
+            return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+        if chunk == b'VP8X':
+            return int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+    if data.startswith(b'\xff\xd8'):
+        i = 2
+        while i + 9 < len(data):
+            if data[i] != 0xFF:
+                i += 1
+                continue
+            marker = data[i + 1]
+            if marker == 0xFF or marker == 0x01 or 0xD0 <= marker <= 0xD8:
+                i += 1 if marker == 0xFF else 2
+                continue
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack('>HH', data[i + 5:i + 9])
+                return width, height
+            i += 2 + struct.unpack('>H', data[i + 2:i + 4])[0]
+    return None
+
+PDF_STREAM = re.compile(rb'stream\r?\n')
+PDF_TEXT_OP = re.compile(rb'\[((?:\\.|[^\]\\])*)\]\s*TJ|\(((?:\\.|[^\\)])*)\)\s*(?:Tj|\'|")', re.S)
+PDF_STRING = re.compile(rb'\(((?:\\.|[^\\)])*)\)', re.S)
+PDF_ESCAPE = re.compile(rb'\\([0-7]{1,3}|.)', re.S)
+PDF_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+PDF_TITLE = re.compile(rb'/Title\s*\(((?:\\.|[^\\)])*)\)')
+
+def decode_pdf_string(raw):
+    def unescape(match):
+        code = match.group(1)
+        if code[:1].isdigit():
+            return bytes([int(code, 8) & 0xFF])
+        return PDF_ESCAPES.get(code, code)
+    data = PDF_ESCAPE.sub(unescape, raw)
+    if data.startswith(b'\xfe\xff'):
+        return data[2:].decode('utf-16-be', errors='ignore')
+    return data.decode('latin-1')
+
+def extract_pdf_text(data, max_chars=PDF_MAX_TEXT_CHARS):
+    """Best-effort text from the first content streams of a (possibly truncated) PDF."""
+    pieces = []
+    length = 0
+    for match in PDF_STREAM.finditer(data):
+        header = data[max(0, match.start() - 300):match.start()]
+        if b'/Image' in header or b'/FontFile' in header or b'/Length1' in header:
+            continue
+        end = data.find(b'endstream', match.end())
+        raw = data[match.end():end if end != -1 else len(data)]
+        if b'/FlateDecode' in header:
+            try:
+                raw = zlib.decompressobj().decompress(raw, max_chars * 50)
+            except zlib.error:
+                continue
+        for op in PDF_TEXT_OP.finditer(raw):
+            strings = PDF_STRING.findall(op.group(1)) if op.group(1) is not None else [op.group(2)]
+            text = ''.join(decode_pdf_string(s) for s in strings)
+            if text.strip() and sum(c.isprintable() for c in text) >= 0.9 * len(text):
+                pieces.append(text)
+                length += len(text) + 1
+        if length >= max_chars:
+            break
+    return ' '.join(' '.join(pieces).split())[:max_chars]
+
+def format_size(size):
+    if size is None:
+        return "unknown size"
+    for unit in ('bytes', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'bytes' else f"{size:.1f} {unit}"
+        size /= 1024
+
+def response_filename(response):
+    disposition = response.content_disposition
+    if disposition is not None and disposition.filename:
+        return disposition.filename
+    return urllib.parse.unquote(response.url.path.rsplit('/', 1)[-1]) or None
+
+def describe_file(response, kind="File", details=None):
+    """Metadata-only record for a non-HTML link, built from the headers without reading the body."""
+    filename = response_filename(response)
+    details = {key: value for key, value in (details or {}).items() if value}
+    metadata = {"type": response.content_type, "size": format_size(response.content_length), "filename": filename}
+    metadata.update(details)
+    summary = f"{kind} ({', '.join([response.content_type, format_size(response.content_length), *details.values()])})"
+    return filename, format_metadata({key: value for key, value in metadata.items() if value}), summary
+
+async def describe_image(response, head):
+    data = head
+    dimensions = image_dimensions(data)
+    if dimensions is None:
+        data += await read_prefix(response, IMAGE_PROBE_BYTES - len(data))
+        dimensions = image_dimensions(data)
+    if dimensions is None:
+        return describe_file(response, "Image")
+    return describe_file(response, "Image", {"dimensions": f"{dimensions[0]}x{dimensions[1]}"})
+
+async def describe_pdf(response, head):
+    data = head + await read_prefix(response, PDF_MAX_BYTES - len(head))
+    text = extract_pdf_text(data)
+    title_match = PDF_TITLE.search(data)
+    pdf_title = decode_pdf_string(title_match.group(1)).strip() if title_match else None
+    title, link_text, summary = describe_file(response, "PDF document", {"title": pdf_title})
+    if text:
+        summary = text[:500]
+    return pdf_title or title, link_text, summary
+
+async def describe_response(response):
+    """(title, link_text, summary, content) for a 200 response, reading only what its content type needs.
+
+    content is the page's main text, set only for HTML pages without a description so it can be summarized."""
+    content_type = response.content_type
+    if content_type.startswith(BINARY_CONTENT_TYPES):
+        return (*describe_file(response), None)
+    head = await read_prefix(response, SNIFF_BYTES)
+    kind = sniff_content_kind(content_type, head)
+    if kind == 'html':
+        page = await read_page_metadata(response, prefix=head)
+        content = None if page.best_description else select_main_content(page.blocks) or None
+        return page.best_title, format_metadata(page.as_dict()), page.best_description, content
+    if kind == 'pdf':
+        return (*await describe_pdf(response, head), None)
+    if kind == 'image':
+        return (*await describe_image(response, head), None)
+    return (*describe_file(response), None)
+
+
+# Persistent storage shared by the caches and indexes below
+DB_PATH = os.getenv('LINKCURATOR_DB', 'linkcurator.db')
+
+def open_database(path=DB_PATH):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+
+# URL canonicalization: every link gets one stable key (and 64-bit hash) for dedup, caches and indexes
+TRACKING_PARAM_PREFIXES = ('utm_', 'pk_', 'mtm_', 'hsa_')
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'gbraid', 'wbraid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid',
+    '_hsenc', '_hsmi', 'mkt_tok', 'ref_src', 'ref_url', 'cmpid', 'oly_anon_id', 'oly_enc_id', 'vero_id',
+}
+# Parameters that only mean "tracking" on particular hosts
+HOST_TRACKING_PARAMS = {
+    'twitter.com': {'s', 't', 'ref_src', 'ref_url'},
+    'youtube.com': {'feature', 'si', 'pp'},
+    'linkedin.com': {'trk', 'trackingid', 'lipi'},
+}
+HOST_ALIASES = {
+    'x.com': 'twitter.com',
+    'mobile.x.com': 'twitter.com',
+    'fxtwitter.com': 'twitter.com',
+    'vxtwitter.com': 'twitter.com',
+    'music.youtube.com': 'youtube.com',
+}
+STRIPPED_SUBDOMAINS = ('www.', 'm.', 'mobile.', 'amp.')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+class URLCanonicalizer:
+    def __init__(self, tracking_params=TRACKING_PARAMS, tracking_prefixes=TRACKING_PARAM_PREFIXES,
+                 host_tracking_params=HOST_TRACKING_PARAMS, host_aliases=HOST_ALIASES,
+                 stripped_subdomains=STRIPPED_SUBDOMAINS, cache_size=65536):
+        # Compile the rule table once; canonicalize() then does no per-call rule setup
+        self.tracking_param = re.compile(
+            "|".join([re.escape(p) + ".*" for p in tracking_prefixes] + [re.escape(p) for p in sorted(tracking_params)]),
+            re.IGNORECASE,
+        )
+        self.host_tracking_params = {host: frozenset(params) for host, params in host_tracking_params.items()}
+        self.host_aliases = dict(host_aliases)
+        # Strips one prefix at a time, and only while a domain with a dot remains (mobile.de stays mobile.de)
+        self.subdomain = re.compile("^(?:" + "|".join(re.escape(s) for s in stripped_subdomains) + ")(?=[^.]+\\.[^.])")
+        self.percent_escape = re.compile(r'%[0-9a-fA-F]{2}')
+        self.canonicalize = functools.lru_cache(maxsize=cache_size)(self._canonicalize)
+
+    def _host(self, host):
+        host = host.lower().rstrip('.')
+        host = self.host_aliases.get(host, host)
+        while True:
+            stripped = self.subdomain.sub('', host, count=1)
+            if stripped == host:
+                break
+            host = stripped
+        return self.host_aliases.get(host, host)
+
+    def _path(self, path):
+        path = self.percent_escape.sub(self._normalize_escape, path)
+        segments = []
+        for segment in path.split('/'):
+            if segment == '..':
+                if segments:
+                    segments.pop()
+            elif segment and segment != '.':
+                segments.append(segment)
+        return '/' + '/'.join(segments)
+
+    @staticmethod
+    def _normalize_escape(match):
+        char = chr(int(match.group(0)[1:], 16))
+        if char.isascii() and (char.isalnum() or char in '-._~'):
+            return char
+        return match.group(0).upper()
+
+    def _query(self, host, query):
+        host_params = self.host_tracking_params.get(host, ())
+        params = [
+            (name, value)
+            for name, value in urllib.parse.parse_qsl(query, keep_blank_values=True)
+            if not self.tracking_param.fullmatch(name) and name.lower() not in host_params
+        ]
+        return urllib.parse.urlencode(sorted(params))
+
+    def _canonicalize(self, url):
+        """Canonical form of a URL: https, aliased host, no tracking params, normalized path, no fragment."""
+        parsed = urllib.parse.urlsplit(url.strip())
+        scheme = parsed.scheme.lower()
+        if scheme == 'http':
+            scheme = 'https'
+        host = self._host(parsed.hostname or '')
+        try:
+            port = parsed.port
+        except ValueError:
+            port = None
+        if port and port != DEFAULT_PORTS.get(parsed.scheme.lower()):
+            host = f"{host}:{port}"
+        return urllib.parse.urlunsplit((scheme, host, self._path(parsed.path), self._query(host, parsed.query), ''))
+
+    def key(self, url):
+        """Stable canonical key and its signed 64-bit hash (fits an SQLite INTEGER)."""
+        canonical = self.canonicalize(url)
+        return canonical, url_hash(canonical)
+
+def url_hash(canonical):
+    return int.from_bytes(hashlib.blake2b(canonical.encode(), digest_size=8).digest(), 'big', signed=True)
+
+url_canonicalizer = URLCanonicalizer()
+canonical_url = url_canonicalizer.canonicalize
+
+
+# URL metadata cache
+METADATA_TTL = 24 * 3600
+METADATA_MIN_TTL = 3600
+METADATA_MAX_TTL = 7 * 24 * 3600
+METADATA_CACHE_MAX_ENTRIES = 50000
+# How many writes between LRU eviction passes
+METADATA_CACHE_EVICT_EVERY = 100
+
+def cache_ttl(response):
+    """TTL for a cached entry: the response's max-age, clamped to our bounds, else the default."""
+    match = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+    if not match:
+        return METADATA_TTL
+    return min(max(int(match.group(1)), METADATA_MIN_TTL), METADATA_MAX_TTL)
+
+@dataclass
+class CachedMetadata:
+    title: str
+    link_text: str
+    summary: str
+    etag: str
+    last_modified: str
+    expires_at: float
+
+    @property
+    def fresh(self):
+        return time.time() < self.expires_at
+
+    def revalidation_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+class MetadataCache:
+    def __init__(self, conn, max_entries=METADATA_CACHE_MAX_ENTRIES):
+        self.conn = conn
+        self.max_entries = max_entries
+        self._writes = 0
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS metadata_cache ("
+                "url TEXT PRIMARY KEY, title TEXT, link_text TEXT, summary TEXT, "
+                "etag TEXT, last_modified TEXT, expires_at REAL, last_access REAL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS metadata_cache_lru ON metadata_cache (last_access)")
+
+    def get(self, url):
+        row = self.conn.execute(
+            "SELECT title, link_text, summary, etag, last_modified, expires_at FROM metadata_cache WHERE url = ?",
+            (url,),
+        ).fetchone()
+        if row is None:
+            return None
+        with self.conn:
+            self.conn.execute("UPDATE metadata_cache SET last_access = ? WHERE url = ?", (time.time(), url))
+        return CachedMetadata(*row)
+
+    def put(self, url, title, link_text, summary, etag=None, last_modified=None, ttl=METADATA_TTL):
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO metadata_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, title, link_text, summary, etag, last_modified, now + ttl, now),
+            )
+        self._writes += 1
+        if self._writes % METADATA_CACHE_EVICT_EVERY == 0:
+            self.evict()
+
+    def refresh(self, url, ttl=METADATA_TTL):
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "UPDATE metadata_cache SET expires_at = ?, last_access = ? WHERE url = ?",
+                (now + ttl, now, url),
+            )
+
+    def evict(self):
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM metadata_cache WHERE url IN "
+                "(SELECT url FROM metadata_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+# Shortened / redirecting links: resolved once with HEAD requests and remembered
+SHORTENER_HOSTS = {
+    't.co', 'bit.ly', 'lnkd.in', 'tinyurl.com', 'goo.gl', 'ow.ly', 'buff.ly', 'dlvr.it', 'trib.al',
+    'is.gd', 'rebrand.ly', 'cutt.ly', 't.ly', 'tiny.cc', 'amzn.to', 'fb.me', 'wp.me', 'flip.it',
+    'youtu.be', 'redd.it', 'spoti.fi', 'apple.co', 'shorturl.at',
+}
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+MAX_REDIRECT_HOPS = 5
+REDIRECT_HOP_TIMEOUT = 3
+# Short links can be re-pointed, so a resolved destination is trusted for a limited time
+REDIRECT_TTL = 30 * 24 * 3600
+
+class RedirectResolver:
+    def __init__(self, conn, shortener_hosts=SHORTENER_HOSTS):
+        self.conn = conn
+        self.shortener_hosts = shortener_hosts
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS redirects (short_url TEXT PRIMARY KEY, final_url TEXT, resolved_at REAL)"
+            )
+
+    def is_short(self, url):
+        host = (urllib.parse.urlsplit(url).hostname or '').lower()
+        return host.removeprefix('www.') in self.shortener_hosts
+
+    def cached(self, url):
+        """Final URL for a short link we have already resolved, without any network call."""
+        row = self.conn.execute(
+            "SELECT final_url FROM redirects WHERE short_url = ? AND resolved_at > ?",
+            (canonical_url(url), time.time() - REDIRECT_TTL),
+        ).fetchone()
+        return row[0] if row else None
+
+    async def resolve(self, url):
+        if not self.is_short(url):
+            return url
+        final_url = self.cached(url)
+        if final_url:
+            return final_url
+        final_url, complete = await self.follow(url)
+        # Only a chain that reached a non-redirect response names the real destination
+        if complete and final_url != url:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO redirects VALUES (?, ?, ?)", (canonical_url(url), final_url, time.time())
+                )
+        return final_url
+
+    async def follow(self, url):
+        """(last URL reached, whether the chain ended on a non-redirect response)."""
+        timeout = aiohttp.ClientTimeout(total=REDIRECT_HOP_TIMEOUT)
+        current = url
+        for _ in range(MAX_REDIRECT_HOPS):
+            await rate_limiter.acquire(urllib.parse.urlsplit(current).hostname)
+            try:
+                async with http_session.head(current, allow_redirects=False, timeout=timeout) as response:
+                    status, location = response.status, response.headers.get('Location')
+                if status in (400, 403, 405, 501):
+                    # Some servers refuse HEAD; a GET whose body we never read works the same
+                    async with http_session.get(current, allow_redirects=False, timeout=timeout) as response:
+                        status, location = response.status, response.headers.get('Location')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Stopped resolving {url} at {current}: {e}")
+                return current, False
+            if status not in REDIRECT_STATUSES or not location:
+                return current, True
+            current = urllib.parse.urljoin(current, location)
+        return current, False
+
+db = None
+metadata_cache = None
+redirect_resolver = None
+
+
 def format_metadata(metadata):
     metadata_text = ""
     for key, value in metadata.items():
         metadata_text += f"{key}: {value}\n"
     return metadata_text
   
-async def fetch_webpage(url):
+# Failure handling: recently failed URLs back off exponentially, unhealthy domains fail fast
+NEGATIVE_CACHE_BASE_DELAY = 60
+NEGATIVE_CACHE_MAX_DELAY = 6 * 3600
+NEGATIVE_CACHE_MAX_ENTRIES = 10000
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 60
+CIRCUIT_MAX_RESET_TIMEOUT = 30 * 60
+
+class NegativeCache:
+    def __init__(self, base_delay=NEGATIVE_CACHE_BASE_DELAY, max_delay=NEGATIVE_CACHE_MAX_DELAY):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.entries = {}  # url -> (consecutive failures, retry at)
+
+    def blocked(self, url):
+        entry = self.entries.get(url)
+        return entry is not None and time.monotonic() < entry[1]
+
+    def record_failure(self, url):
+        failures = self.entries.get(url, (0, 0))[0] + 1
+        delay = min(self.base_delay * 2 ** (failures - 1), self.max_delay)
+        self.entries[url] = (failures, time.monotonic() + delay)
+        if len(self.entries) > NEGATIVE_CACHE_MAX_ENTRIES:
+            self.prune()
+
+    def clear(self, url):
+        self.entries.pop(url, None)
+
+    def prune(self):
+        now = time.monotonic()
+        # Keep expired entries for a while so repeat failures keep growing the backoff
+        self.entries = {url: entry for url, entry in self.entries.items() if now < entry[1] + self.max_delay}
+
+class CircuitState(Enum):
+    CLOSED = 1
+    OPEN = 2
+    HALF_OPEN = 3
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT,
+                 max_reset_timeout=CIRCUIT_MAX_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe = None  # permit held by the one request probing a half-open circuit
+
+    def allow(self):
+        """A permit for one request, or None to fail fast. Pass the permit back to record_failure() and release()."""
+        if self.state is CircuitState.CLOSED:
+            return True
+        if self.state is CircuitState.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return None
+            self.state = CircuitState.HALF_OPEN
+        # Half-open: let a single probe request through at a time
+        if self.probe is not None:
+            return None
+        self.probe = object()
+        return self.probe
+
+    def record_success(self):
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.reset_timeout = self.base_reset_timeout
+        self.probe = None
+
+    def record_failure(self, permit=True):
+        self.failures += 1
+        self.release(permit)
+        if self.state is CircuitState.HALF_OPEN:
+            self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+            self.open()
+        elif self.failures >= self.failure_threshold:
+            self.open()
+
+    def release(self, permit):
+        """Free the probe slot, if this permit holds it; requests let in while closed never do."""
+        if permit is self.probe:
+            self.probe = None
+
+    def open(self):
+        self.state = CircuitState.OPEN
+        self.opened_at = time.monotonic()
+
+    @property
+    def retry_in(self):
+        if self.state is not CircuitState.OPEN:
+            return 0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+class CircuitBreakers:
+    def __init__(self):
+        self.breakers = {}
+
+    def get(self, host):
+        domain = (host or '').lower().removeprefix('www.')
+        if domain not in self.breakers:
+            self.breakers[domain] = CircuitBreaker()
+        return self.breakers[domain]
+
+    def unhealthy(self):
+        return {domain: breaker for domain, breaker in self.breakers.items() if breaker.state is not CircuitState.CLOSED}
+
+negative_cache = NegativeCache()
+circuit_breakers = CircuitBreakers()
+
+def is_domain_failure(status):
+    """Statuses that say the site is unhealthy or blocking us, rather than that one URL is bad."""
+    return status >= 500 or status in (403, 429)
+
+def is_permanent_failure(status):
+    """Statuses that say this one URL is bad (404, 410, ...), so fetching it again will not help."""
+    return 400 <= status < 500 and status not in (403, 408, 425, 429)
+
+@dataclass
+class FetchedLink:
+    title: str = None
+    link_text: str = None
+    summary: str = None
+    tweet: dict = None  # Twitter card metadata, still to be formatted and summarized
+    content: str = None  # main page text to summarize when the page has no description
+    from_cache: bool = False
+    etag: str = None
+    last_modified: str = None
+    ttl: float = METADATA_TTL
+    gone: bool = False  # the server rejected the URL for good and nothing is cached for it
+
+def from_cache(cached):
+    if cached:
+        return FetchedLink(cached.title, cached.link_text, cached.summary, from_cache=True)
+    return None
+
+async def fetch_link(url):
+    """Network stage of link processing: cached metadata, or whatever the page itself tells us. None on failure."""
     try:
         parsed_url = urllib.parse.urlparse(url)
         if not parsed_url.scheme or not parsed_url.netloc:
             raise ValueError("Invalid URL")
         encoded_url = urllib.parse.quote(url, safe=":/?#[]@!$&'()*+,;=")
-        await asyncio.sleep(1)  # to respect rate limits
-        timeout = aiohttp.ClientTimeout(total=10)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(encoded_url) as response:
-                if response.status == 200:
-                    if "twitter.com" in response.url.host:  # Check if the URL is from Twitter
-                        # Fetch card metadata from Twitter
-                        metadata = await fetch_twitter_card_metadata(url)
-                        link_text = format_metadata(metadata)
-                        summary = summarize_with_gpt3(link_text)
-                        link_title = make_title_with_gpt(link_text)
-                        if not link_title:
-                            link_title = "Untitled"  
-                        if len(link_title) > 100:
-                            link_title = link_title[:100]  
-
-                        return link_title, link_text, summary
+        cache_key = canonical_url(url)
+        cached = metadata_cache.get(cache_key)
+        if cached and cached.fresh:
+            return from_cache(cached)
+        # A stale cache entry beats no answer while a URL or its domain is failing
+        if negative_cache.blocked(cache_key):
+            print("Skipping recently failed URL:", url)
+            return from_cache(cached)
+        breaker = circuit_breakers.get(parsed_url.hostname)
+        permit = breaker.allow()
+        if not permit:
+            print(f"Circuit open for {parsed_url.hostname}, not fetching:", url)
+            return from_cache(cached)
+        await rate_limiter.acquire(parsed_url.hostname)
+        headers = cached.revalidation_headers() if cached else {}
+        try:
+            async with http_session.get(encoded_url, headers=headers) as response:
+                if response.status == 304 and cached:
+                    breaker.record_success()
+                    # Unchanged since we cached it: skip the body, the parse and the LLM calls
+                    metadata_cache.refresh(cache_key, cache_ttl(response))
+                    return from_cache(cached)
+                if response.status != 200:
+                    print(f"Failed to fetch webpage: {response.status} {response.reason}")
+                    negative_cache.record_failure(cache_key)
+                    if is_domain_failure(response.status):
+                        breaker.record_failure(permit)
                     else:
-                        webpage_content = await response.text()
-                        soup = BeautifulSoup(webpage_content, 'html.parser')
-                        link_title = soup.title.string if soup.title else message.content
-                        metadata = response.headers  # Pass the response headers as metadata
-                        link_text = format_metadata(metadata)
-                        if not link_title:
-                            link_title = "Untitled"  
-                        if len(link_title) > 100:
-                            link_title = link_title[:100] 
-                        summary = metadata.get('description', 'No description available.')
-                        return link_title, link_text, summary
-                      
+                        breaker.record_success()
+                    if is_permanent_failure(response.status) and not cached:
+                        return FetchedLink(gone=True)
+                    return from_cache(cached)
+                breaker.record_success()
+                negative_cache.clear(cache_key)
+                fetched = FetchedLink(
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified'),
+                    ttl=cache_ttl(response),
+                )
+                if "twitter.com" in response.url.host:  # Check if the URL is from Twitter
+                    # Fetch card metadata from Twitter
+                    fetched.tweet = await fetch_twitter_card_metadata(url)
+                    if not fetched.tweet.get('text'):
+                        # The Twitter API failed; fail the link so the job is retried, and cache nothing
+                        print("No tweet text for", url)
+                        return from_cache(cached)
                 else:
-                    print(f"Failed to fetch webpage: {response.status} {response.reason}")
-                    return None, None
+                    fetched.title, fetched.link_text, fetched.summary, fetched.content = await describe_response(response)
+                return fetched
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Failed to fetch webpage {url}: {e!r}")
+            negative_cache.record_failure(cache_key)
+            breaker.record_failure(permit)
+            return from_cache(cached)
+        finally:
+            breaker.release(permit)
     except ValueError:
         print("Invalid URL:", url)
-        return None, None
+        return None
 
 
 async def fetch_twitter_card_metadata(url):
@@ -120,11 +1152,11 @@ async def fetch_twitter_card_metadata(url):
 
         headers = {"Authorization": f"Bearer {bearer_token}", "User-Agent": "v2FullArchiveSearchPython"}
         print("Sending request to Twitter API...")
+        await rate_limiter.acquire('api.twitter.com')
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"https://api.twitter.com/2/tweets/{tweet_id}", headers=headers) as response:
-                print("Received response from Twitter API.")
-                tweet = await response.json()
+        async with http_session.get(f"https://api.twitter.com/2/tweets/{tweet_id}", headers=headers) as response:
+            print("Received response from Twitter API.")
+            tweet = await response.json()
 
         if 'data' in tweet:
             tweet = tweet['data']
@@ -142,55 +1174,1484 @@ async def fetch_twitter_card_metadata(url):
         return {}
 
 
-def make_title_with_gpt(link_text):
-    time.sleep(1)  # Sleep for 1 second
-    max_context_length = 2000
-    prompt_length = max_context_length - 500
-    prompt = f"{link_text[:prompt_length]}\n\nCreate a title based on the text provided:"
-    response = openai.Completion.create(
-        engine="text-davinci-003",
-        prompt=prompt,
-        max_tokens=100
-    )
-    link_title = response.choices[0].text.strip()
-    return link_title
-
-def summarize_with_gpt3(text):
-    max_context_length = 7000
-    prompt_length = max_context_length - 500
-    time.sleep(1)  # Sleep for 1 second
-    prompt = f"{text[:prompt_length]}\n\nSummarize the above content between 2 to 7 setences:"
-    response = openai.Completion.create(
-        engine="text-davinci-003",
-        prompt=prompt,
-        max_tokens=100
+# OpenAI completions go over the shared HTTP session, so they never block the event loop
+OPENAI_COMPLETIONS_URL = "https://api.openai.com/v1/completions"
+OPENAI_MODEL = "text-davinci-003"
+LLM_TIMEOUT = 30
+
+# Adaptive (AIMD) concurrency for LLM calls: grow by one slot per window of successes,
+# halve on a 429, shrink gently when responses slow past the latency target
+LLM_INITIAL_CONCURRENCY = 4
+LLM_MIN_CONCURRENCY = 1
+LLM_MAX_CONCURRENCY = 32
+LLM_TARGET_LATENCY = 10.0
+LLM_SLOW_DECREASE = 0.9
+LLM_THROTTLE_DECREASE = 0.5
+LLM_MAX_RETRIES = 4
+LLM_BACKOFF_BASE = 1.0
+LLM_BACKOFF_MAX = 60.0
+LLM_DEFAULT_RETRY_AFTER = 5.0
+# Lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKFILL = 1
+
+RATE_LIMIT_DURATION = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+class LLMError(Exception):
+    pass
+
+def parse_duration(value):
+    """Seconds from a Retry-After value or an OpenAI reset header such as '1m30s' or '250ms'."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    parts = RATE_LIMIT_DURATION.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+def rate_limit_pause(headers):
+    """How long to hold all LLM calls: until the reset of any exhausted request or token window."""
+    pause = 0.0
+    for kind in ('requests', 'tokens'):
+        remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+        if remaining is not None and remaining.isdigit() and int(remaining) == 0:
+            pause = max(pause, parse_duration(headers.get(f'x-ratelimit-reset-{kind}')) or 0.0)
+    return pause
+
+class AdaptiveLimiter:
+    def __init__(self, initial=LLM_INITIAL_CONCURRENCY, minimum=LLM_MIN_CONCURRENCY, maximum=LLM_MAX_CONCURRENCY,
+                 target_latency=LLM_TARGET_LATENCY):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.waiters = []  # heap of (priority, sequence, future)
+        self.sequence = 0
+        self.paused_until = 0.0
+        self.timer = None
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.total_latency = 0.0
+
+    @property
+    def capacity(self):
+        return max(self.minimum, int(self.limit))
+
+    @property
+    def paused_for(self):
+        return max(self.paused_until - time.monotonic(), 0.0)
+
+    async def acquire(self, priority=PRIORITY_INTERACTIVE):
+        if not self.waiters and not self.paused_for and self.in_flight < self.capacity:
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, self.sequence, future))
+        self.sequence += 1
+        if self.timer is None:
+            self.grant()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Granted just as the caller was cancelled: hand the slot on
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self.grant()
+
+    def grant(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        paused_for = self.paused_for
+        if paused_for:
+            if self.waiters:
+                self.timer = asyncio.get_running_loop().call_later(paused_for, self.grant)
+            return
+        while self.waiters and self.in_flight < self.capacity:
+            _, _, future = heapq.heappop(self.waiters)
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def record_success(self, latency):
+        self.requests += 1
+        self.total_latency += latency
+        if latency > self.target_latency:
+            self.limit = max(self.minimum, self.limit * LLM_SLOW_DECREASE)
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def record_throttle(self, retry_after):
+        self.throttled += 1
+        self.limit = max(self.minimum, self.limit * LLM_THROTTLE_DECREASE)
+        self.pause(retry_after)
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self.waiters),
+            "paused_for": self.paused_for,
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "avg_latency": self.total_latency / self.requests if self.requests else 0.0,
+        }
+
+llm_limiter = AdaptiveLimiter()
+
+# Optional cap on OpenAI tokens per hour (0 = unlimited); past it, the local summarizer takes over
+LLM_TOKENS_PER_HOUR = int(os.getenv('LINKCURATOR_LLM_TOKENS_PER_HOUR', '0'))
+
+class TokenBudget:
+    def __init__(self, per_hour=LLM_TOKENS_PER_HOUR):
+        self.per_hour = per_hour
+        self.window_start = time.monotonic()
+        self.spent = 0
+
+    def roll(self):
+        if time.monotonic() - self.window_start >= 3600:
+            self.window_start = time.monotonic()
+            self.spent = 0
+
+    def spend(self, tokens):
+        self.roll()
+        self.spent += tokens
+
+    @property
+    def exhausted(self):
+        self.roll()
+        return bool(self.per_hour) and self.spent >= self.per_hour
+
+llm_budget = TokenBudget()
+
+def backoff_delay(attempt):
+    """Full jitter: anywhere up to the exponential ceiling, so retries from many callers spread out."""
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+async def openai_completion(prompt, max_tokens=100, priority=PRIORITY_INTERACTIVE):
+    payload = {"model": OPENAI_MODEL, "prompt": prompt, "max_tokens": max_tokens}
+    headers = {"Authorization": f"Bearer {openai_api_key}"}
+    timeout = aiohttp.ClientTimeout(total=LLM_TIMEOUT)
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        retry_after = None
+        await llm_limiter.acquire(priority)
+        started = time.monotonic()
+        try:
+            # prompt may be a list: one choice per prompt comes back, tagged with its index
+            async with http_session.post(OPENAI_COMPLETIONS_URL, json=payload, headers=headers, timeout=timeout) as response:
+                llm_limiter.pause(rate_limit_pause(response.headers))
+                try:
+                    body = await response.json(content_type=None)
+                except ValueError:
+                    # Proxies and load balancers answer errors with HTML or plain text
+                    body = None
+                if response.status == 200 and isinstance(body, dict):
+                    llm_limiter.record_success(time.monotonic() - started)
+                    llm_budget.spend(body.get('usage', {}).get('total_tokens', 0))
+                    return body
+                error = body.get('error') if isinstance(body, dict) else None
+                error = error if isinstance(error, dict) else {}
+                reason = "unreadable response body" if response.status == 200 else error.get('message') or response.reason
+                failure = LLMError(f"OpenAI request failed: {response.status} {reason}")
+                # An exhausted quota is also a 429, but waiting will not fix it
+                if error.get('code') == 'insufficient_quota' or (response.status != 429 and response.status < 500):
+                    raise failure
+                if response.status == 429:
+                    retry_after = parse_duration(response.headers.get('Retry-After')) or LLM_DEFAULT_RETRY_AFTER
+                    llm_limiter.record_throttle(retry_after)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            failure = LLMError(f"OpenAI request failed: {e or type(e).__name__}")
+            llm_limiter.record_success(LLM_TIMEOUT)  # counts as a slow response
+        finally:
+            llm_limiter.release()
+        if attempt == LLM_MAX_RETRIES:
+            raise failure
+        llm_limiter.retries += 1
+        delay = retry_after + random.uniform(0, LLM_BACKOFF_BASE) if retry_after else backoff_delay(attempt)
+        print(f"{failure}; retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+SUMMARY_MAX_TOKENS = 350
+SUMMARY_MAX_TAGS = 5
+SUMMARY_PROMPT = (
+    "{text}\n\n"
+    "Describe the content above as a JSON object with these keys:\n"
+    '"title": a title of at most 100 characters,\n'
+    '"summary": a summary of 2 to 7 sentences,\n'
+    '"tags": a list of up to 5 short topic tags.\n'
+    "JSON:"
+)
+# Fields of malformed or truncated JSON (e.g. cut off by max_tokens)
+SUMMARY_JSON_FIELD = re.compile(r'"(title|summary)"\s*:\s*"((?:\\.|[^"\\])*)', re.IGNORECASE)
+SUMMARY_LABEL = re.compile(r'^\s*(?:\*\*)?(title|summary|tags)(?:\*\*)?\s*:\s*(.*)$', re.IGNORECASE)
+
+@dataclass
+class LinkSummary:
+    title: str = None
+    summary: str = None
+    tags: list = field(default_factory=list)
+
+def parse_tags(tags):
+    if isinstance(tags, str):
+        tags = re.split(r'[,#\n]', tags)
+    if not isinstance(tags, list):
+        return []
+    tags = [str(tag).strip().strip('"\'') for tag in tags]
+    return [tag for tag in tags if tag][:SUMMARY_MAX_TAGS]
+
+def parse_link_summary(text):
+    """Parse the model's answer: JSON if possible, else "Title:/Summary:/Tags:" lines, else plain text."""
+    text = text.strip()
+    if not text:
+        return LinkSummary()
+    start, end = text.find('{'), text.rfind('}')
+    data = None
+    if start != -1 and end > start:
+        try:
+            data = json.loads(text[start:end + 1])
+        except ValueError:
+            pass
+        if isinstance(data, dict):
+            data = {str(key).lower(): value for key, value in data.items()}
+            title, summary = data.get('title'), data.get('summary')
+            if isinstance(title, str) or isinstance(summary, str):
+                return LinkSummary(
+                    title=title.strip() if isinstance(title, str) else None,
+                    summary=summary.strip() if isinstance(summary, str) else None,
+                    tags=parse_tags(data.get('tags')),
+                )
+    if start != -1:
+        salvaged = {name.lower(): value for name, value in SUMMARY_JSON_FIELD.findall(text[start:])}
+        if salvaged:
+            return LinkSummary(salvaged.get('title', '').strip() or None, salvaged.get('summary', '').strip() or None)
+        return LinkSummary()
+    fields = {}
+    label = None
+    for line in text.splitlines():
+        match = SUMMARY_LABEL.match(line)
+        if match:
+            label = match.group(1).lower()
+            fields[label] = match.group(2).strip()
+        elif label and line.strip():
+            fields[label] += " " + line.strip()
+    if fields.get('title') or fields.get('summary'):
+        return LinkSummary(fields.get('title') or None, fields.get('summary') or None, parse_tags(fields.get('tags', '')))
+    # Unstructured answer: use it as the summary and its first line as the title
+    first_line = text.splitlines()[0].strip().strip('"')
+    return LinkSummary(title=first_line if len(first_line) <= 100 else None, summary=text)
+
+# LLM results cached by content: the same text (a reshared tweet, one article under several URLs) is summarized once
+# Bump whenever SUMMARY_PROMPT or the parsing of its answer changes
+SUMMARY_PROMPT_VERSION = 1
+LLM_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+def llm_cache_key(text, model=OPENAI_MODEL, prompt_version=SUMMARY_PROMPT_VERSION):
+    normalized = ' '.join(text.split()).casefold()
+    return hashlib.sha256(f"{model}\0{prompt_version}\0{normalized}".encode()).hexdigest()
+
+class LLMCache:
+    def __init__(self, conn, max_bytes=LLM_CACHE_MAX_BYTES):
+        self.conn = conn
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT, size INTEGER, last_access REAL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_lru ON llm_cache (last_access)")
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+    @property
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key):
+        row = self.conn.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        with self.conn:
+            self.conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        data = json.dumps(value)
+        old = self.conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?)", (key, data, len(data), time.time()))
+        self.total_bytes += len(data) - (old[0] if old else 0)
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache is back under 90% of its size cap."""
+        excess = self.total_bytes - int(self.max_bytes * 0.9)
+        keys = []
+        for key, size in self.conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access"):
+            if excess <= 0:
+                break
+            keys.append((key,))
+            excess -= size
+            self.total_bytes -= size
+        with self.conn:
+            self.conn.executemany("DELETE FROM llm_cache WHERE key = ?", keys)
+
+llm_cache = None
+
+def cached_link_summary(key):
+    cached = llm_cache.get(key)
+    return LinkSummary(**cached) if cached is not None else None
+
+def store_link_summary(key, answer):
+    result = parse_link_summary(answer)
+    if result.title or result.summary:
+        llm_cache.put(key, dataclasses.asdict(result))
+    return result
+
+async def summarize_link(text, priority=PRIORITY_INTERACTIVE):
+    """Title, summary and tags for a link in a single completion, or straight from the LLM cache."""
+    text = fit_to_token_budget(text)
+    key = llm_cache_key(text)
+    cached = cached_link_summary(key)
+    if cached is not None:
+        return cached
+    response = await openai_completion(SUMMARY_PROMPT.format(text=text), max_tokens=SUMMARY_MAX_TOKENS, priority=priority)
+    choices = response.get('choices') or []
+    if not choices:
+        raise LLMError("OpenAI returned no completion")
+    return store_link_summary(key, choices[0].get('text', ''))
+
+
+# Backfills (organize) summarize in batches: the completions API takes a list of prompts per request.
+# Interactive links never wait for a batch.
+LLM_BATCH_SIZE = 10
+LLM_BATCH_MAX_WAIT = 2.0
+LLM_BATCH_MAX_PENDING = 4 * LLM_BATCH_SIZE
+
+class BatchSummarizer:
+    def __init__(self, batch_size=LLM_BATCH_SIZE, max_wait=LLM_BATCH_MAX_WAIT, max_pending=LLM_BATCH_MAX_PENDING):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.slots = asyncio.Semaphore(max_pending)
+        self.pending = []  # (cache key, text, future)
+        self.timer = None
+        self.batches = 0
+        self.items = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    async def reserve(self):
+        """Wait for room in the batch buffer; call before summarize() so backfills cannot queue without bound."""
+        await self.slots.acquire()
+
+    async def summarize(self, text):
+        try:
+            text = fit_to_token_budget(text)
+            key = llm_cache_key(text)
+            cached = cached_link_summary(key)
+            if cached is not None:
+                return cached
+            future = asyncio.get_running_loop().create_future()
+            self.pending.append((key, text, future))
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+            elif self.timer is None:
+                self.timer = asyncio.get_running_loop().call_later(self.max_wait, self.flush)
+            return await future
+        finally:
+            self.slots.release()
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        while self.pending:
+            batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            spawn(self.run(batch))
+
+    async def run(self, batch):
+        prompts = [SUMMARY_PROMPT.format(text=text) for _, text, _ in batch]
+        try:
+            response = await openai_completion(prompts, max_tokens=SUMMARY_MAX_TOKENS, priority=PRIORITY_BACKFILL)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        usage = response.get('usage', {})
+        self.batches += 1
+        self.items += len(batch)
+        self.prompt_tokens += usage.get('prompt_tokens', 0)
+        self.completion_tokens += usage.get('completion_tokens', 0)
+        print(f"Summarized batch of {len(batch)}: {usage.get('prompt_tokens', 0)} prompt tokens, "
+              f"{usage.get('completion_tokens', 0)} completion tokens")
+        for choice in response.get('choices') or []:
+            key, _, future = batch[choice['index']]
+            if not future.done():
+                future.set_result(store_link_summary(key, choice['text']))
+        for _, _, future in batch:
+            if not future.done():
+                future.set_exception(LLMError("No completion returned for prompt in batch"))
+
+batch_summarizer = None
+
+
+# Local extractive summarizer: TF-IDF sentence scoring, no network, a few milliseconds per link.
+# Serves short content and takes over whenever the LLM is over budget, throttled or too slow.
+SUMMARIZER_MODES = ('auto', 'llm', 'local')
+LOCAL_SUMMARY_SENTENCES = 3
+LOCAL_SUMMARY_MAX_CHARS = 600
+LOCAL_TITLE_MAX_CHARS = 80
+# In auto mode, content this short (a tweet, a one-paragraph page) never goes to the LLM
+LOCAL_SUMMARY_MAX_TOKENS = 100
+# Interactive links wait at most this long for the LLM before falling back
+LLM_LATENCY_SLO = 20.0
+WORD_PATTERN = re.compile(r"[^\W\d_]{3,}")
+STOPWORDS = frozenset("""
+    about above after again against all also and any are because been before being below between both but
+    can could did does doing down during each few for from further had has have having her here hers him his
+    how into its just more most not now off once only other our ours out over own same she should some such
+    than that the their theirs them then there these they this those through too under until very was were
+    what when where which while who whom why will with would you your yours http https www com
+""".split())
+
+def local_summary(text, sentences=LOCAL_SUMMARY_SENTENCES):
+    """Title, summary and tags from the text itself: the top TF-IDF sentences in their original order."""
+    text = ' '.join(text.split())
+    candidates = [sentence for sentence in SENTENCE_END.split(text) if sentence]
+    if not candidates:
+        return LinkSummary()
+    terms = [[word for word in WORD_PATTERN.findall(sentence.lower()) if word not in STOPWORDS] for sentence in candidates]
+    document_frequency = Counter(word for words in terms for word in set(words))
+    term_frequency = Counter(word for words in terms for word in words)
+    weights = {
+        word: count * (math.log((1 + len(candidates)) / (1 + document_frequency[word])) + 1)
+        for word, count in term_frequency.items()
+    }
+
+    def score(index):
+        words = terms[index]
+        return sum(weights[word] for word in set(words)) / math.sqrt(len(words)) if words else 0.0
+
+    best = sorted(sorted(range(len(candidates)), key=score, reverse=True)[:sentences])
+    summary = shorten(' '.join(candidates[index] for index in best), LOCAL_SUMMARY_MAX_CHARS)
+    tags = [word for word, _ in sorted(weights.items(), key=lambda item: item[1], reverse=True)[:SUMMARY_MAX_TAGS]]
+    return LinkSummary(title=shorten(candidates[0], LOCAL_TITLE_MAX_CHARS), summary=summary, tags=tags)
+
+class SummarizerSettings:
+    """Summarizer mode per guild, optionally overridden per domain (and its subdomains)."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS summarizer_settings "
+                "(guild_id INTEGER, domain TEXT, mode TEXT, PRIMARY KEY (guild_id, domain))"
+            )
+        self.modes = {
+            (guild_id, domain): mode
+            for guild_id, domain, mode in self.conn.execute("SELECT guild_id, domain, mode FROM summarizer_settings")
+        }
+
+    def mode(self, guild_id, host=None):
+        while host:
+            if (guild_id, host) in self.modes:
+                return self.modes[guild_id, host]
+            host = host.partition('.')[2]
+        return self.modes.get((guild_id, ''), 'auto')
+
+    def set(self, guild_id, mode, domain=''):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO summarizer_settings VALUES (?, ?, ?)", (guild_id, domain, mode))
+        self.modes[guild_id, domain] = mode
+
+    def for_guild(self, guild_id):
+        return sorted((domain, mode) for (g, domain), mode in self.modes.items() if g == guild_id)
+
+summarizer_settings = None
+summarizer_counts = Counter()
+
+def choose_summarizer(guild_id, url, text):
+    mode = summarizer_settings.mode(guild_id, urllib.parse.urlsplit(url).hostname)
+    if mode == 'local':
+        return 'local'
+    if llm_budget.exhausted or llm_limiter.paused_for > LLM_LATENCY_SLO:
+        return 'local'
+    if mode == 'auto' and count_tokens(text) <= LOCAL_SUMMARY_MAX_TOKENS:
+        return 'local'
+    return 'llm'
+
+def fallback_summary(url, text, error):
+    print(f"LLM summary unavailable for {url} ({error!r}); using the local summarizer")
+    summarizer_counts['fallback'] += 1
+    return local_summary(text)
+
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one in-flight call whose result all callers share."""
+    def __init__(self):
+        self._calls = {}
+
+    async def run(self, key, func, *args):
+        future = self._calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark as retrieved when nobody else was waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+class KeyedLocks:
+    """One asyncio.Lock per key, dropped again once nobody holds or waits for it."""
+    def __init__(self):
+        self._locks = {}
+        self._users = {}
+
+    @contextlib.asynccontextmanager
+    async def hold(self, key):
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+# Page fetches are shared across guilds; thread creation is serialized per guild and title
+fetch_flights = SingleFlight()
+thread_locks = KeyedLocks()
+
+
+# Link extraction from message text
+MAX_LINKS_PER_MESSAGE = 10
+URL_PATTERN = re.compile(
+    r'\[[^\]]*\]\(\s*<?(https?://(?:[^\s()<>]|\([^\s()<>]*\))+)>?\s*\)'  # markdown [text](url)
+    r'|<(https?://[^\s<>]+)>'  # <url>, Discord's embed suppression
+    r'|(https?://[^\s<>`]+)',  # bare url, ended by a backtick as in `code spans`
+    re.IGNORECASE,
+)
+TRAILING_PUNCTUATION = '.,;:!?\'"*_~|`'
+
+def strip_trailing_punctuation(url):
+    while url:
+        if url[-1] in TRAILING_PUNCTUATION:
+            url = url[:-1]
+        elif url[-1] == ')' and url.count('(') < url.count(')'):
+            url = url[:-1]
+        else:
+            break
+    return url
+
+def extract_urls(text, limit=MAX_LINKS_PER_MESSAGE):
+    """Links in a message, in order, without repeats (by canonical form)."""
+    urls = []
+    seen = set()
+    for match in URL_PATTERN.finditer(text):
+        markdown, suppressed, bare = match.groups()
+        url = markdown or suppressed or strip_trailing_punctuation(bare)
+        key = canonical_url(url)
+        if key not in seen:
+            seen.add(key)
+            urls.append(url)
+            if len(urls) >= limit:
+                break
+    return urls
+
+# Durable job queue: every queued message is in SQLite until its links are done, so restarts lose nothing
+JOB_VISIBILITY_TIMEOUT = 15 * 60
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 5 * 60
+JOB_BATCH_SIZE = 100
+# Writes are group-committed: one transaction per batch or per flush interval, whichever comes first
+JOB_FLUSH_INTERVAL = 0.05
+JOB_POLL_INTERVAL = 5
+# Leases of jobs still in the pipeline are renewed well before they run out
+JOB_LEASE_RENEW_INTERVAL = JOB_VISIBILITY_TIMEOUT / 3
+
+class JobQueue:
+    def __init__(self, conn):
+        self.conn = conn
+        self.writes = []  # (operation, argument, future or None)
+        self.flush_handle = None
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, payload TEXT, state TEXT, "
+                "attempts INTEGER, lease_until REAL, available_at REAL, created_at REAL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_available ON jobs (state, available_at)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS dead_jobs (id INTEGER PRIMARY KEY, payload TEXT, attempts INTEGER, "
+                "error TEXT, failed_at REAL)"
+            )
+
+    def recover(self):
+        """Release jobs leased by a previous run of the bot so they get leased again. Returns how many."""
+        with self.conn:
+            return self.conn.execute(
+                "UPDATE jobs SET state = 'pending', available_at = ? WHERE state = 'leased'", (time.time(),)
+            ).rowcount
+
+    async def enqueue(self, payload):
+        """Durably add a job, already leased to the caller. Returns its id once committed."""
+        future = asyncio.get_running_loop().create_future()
+        self._write('enqueue', payload, future)
+        return await future
+
+    def ack(self, job_id):
+        self._write('ack', job_id)
+
+    def nack(self, job_id, error=None):
+        self._write('nack', (job_id, error))
+
+    def _write(self, operation, argument, future=None):
+        self.writes.append((operation, argument, future))
+        if len(self.writes) >= JOB_BATCH_SIZE:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(JOB_FLUSH_INTERVAL, self.flush)
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        writes, self.writes = self.writes, []
+        if not writes:
+            return
+        now = time.time()
+        results = []
+        try:
+            with self.conn:
+                for operation, argument, _ in writes:
+                    if operation == 'enqueue':
+                        cursor = self.conn.execute(
+                            "INSERT INTO jobs (payload, state, attempts, lease_until, available_at, created_at) "
+                            "VALUES (?, 'leased', 1, ?, ?, ?)",
+                            (json.dumps(argument), now + JOB_VISIBILITY_TIMEOUT, now, now),
+                        )
+                        results.append(cursor.lastrowid)
+                    elif operation == 'ack':
+                        self.conn.execute("DELETE FROM jobs WHERE id = ?", (argument,))
+                        results.append(None)
+                    else:
+                        self._nack(*argument, now=now)
+                        results.append(None)
+        except sqlite3.Error as e:
+            for _, _, future in writes:
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            raise
+        for (_, _, future), result in zip(writes, results):
+            if future is not None and not future.done():
+                future.set_result(result)
+
+    def _nack(self, job_id, error, now):
+        row = self.conn.execute("SELECT payload, attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return
+        payload, attempts = row
+        if attempts >= JOB_MAX_ATTEMPTS:
+            self.conn.execute("INSERT INTO dead_jobs VALUES (?, ?, ?, ?, ?)", (job_id, payload, attempts, error, now))
+            self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        else:
+            self.conn.execute(
+                "UPDATE jobs SET state = 'pending', available_at = ? WHERE id = ?",
+                (now + JOB_RETRY_DELAY * 2 ** (attempts - 1), job_id),
+            )
+
+    def lease(self, limit=JOB_BATCH_SIZE, exclude=()):
+        """Lease up to limit jobs that are due, or whose lease ran out. Returns (id, payload, attempts) tuples."""
+        now = time.time()
+        rows = self.conn.execute(
+            "SELECT id, payload, attempts FROM jobs WHERE ((state = 'pending' AND available_at <= ?) "
+            "OR (state = 'leased' AND lease_until < ?)) AND id NOT IN (SELECT value FROM json_each(?)) "
+            "ORDER BY id LIMIT ?",
+            (now, now, json.dumps(list(exclude)), limit),
+        ).fetchall()
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE jobs SET state = 'leased', attempts = attempts + 1, lease_until = ? WHERE id = ?",
+                [(now + JOB_VISIBILITY_TIMEOUT, row[0]) for row in rows],
+            )
+        return [(job_id, json.loads(payload), attempts + 1) for job_id, payload, attempts in rows]
+
+    def renew(self, job_ids):
+        """Extend the leases of jobs still being processed, so they never look abandoned."""
+        with self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE state = 'leased' AND id IN (SELECT value FROM json_each(?))",
+                (time.time() + JOB_VISIBILITY_TIMEOUT, json.dumps(list(job_ids))),
+            )
+
+    def stats(self):
+        counts = dict(self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+        counts['dead'] = self.conn.execute("SELECT COUNT(*) FROM dead_jobs").fetchone()[0]
+        counts['unflushed'] = len(self.writes)
+        return counts
+
+job_queue = None
+
+
+# Link-processing pipeline: extract -> canonicalize -> dedup -> fetch -> parse -> summarize -> publish.
+# Each stage has its own worker pool and a bounded queue, so a slow stage backs up only the stages before it.
+PIPELINE_STAGES = {  # stage: (workers, queue size)
+    'extract': (2, 100),
+    'canonicalize': (4, 200),
+    'dedup': (2, 200),
+    'fetch': (16, 200),
+    'parse': (2, 200),
+    'summarize': (4, 100),
+    'publish': (2, 100),
+}
+CURATED_RESULTS = (ProcessLinkResult.ADDED, ProcessLinkResult.ALREADY_EXISTS, ProcessLinkResult.THREAD_EXISTS)
+UNTITLED = "Untitled"
+# Reposts of a known link revalidate its cached metadata in the background (no LLM calls)
+REFRESH_KNOWN_LINKS = True
+
+background_tasks = set()
+
+def spawn(coro):
+    """Run a coroutine in the background, keeping a reference so it is not garbage collected."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+class MessageJob:
+    """A message whose links go through the pipeline. done resolves to one ProcessLinkResult per link."""
+    def __init__(self, guild, channel, message_id, content, origin='message', queue_id=None, attempts=1):
+        self.guild = guild
+        self.channel = channel
+        self.message_id = message_id
+        self.content = content
+        self.origin = origin
+        self.queue_id = queue_id
+        self.attempts = attempts
+        self.links = []
+        self.done = asyncio.get_running_loop().create_future()
+
+    @classmethod
+    def from_payload(cls, payload, queue_id, attempts):
+        """Rebuild a queued job; None if its guild or channel is gone."""
+        guild = client.get_guild(payload['guild_id'])
+        channel = guild.get_channel_or_thread(payload['channel_id']) if guild else None
+        if channel is None:
+            return None
+        return cls(guild, channel, payload['message_id'], payload['content'], payload['origin'], queue_id, attempts)
+
+    def payload(self):
+        return {
+            "guild_id": self.guild.id,
+            "channel_id": self.channel.id,
+            "message_id": self.message_id,
+            "content": self.content,
+            "origin": self.origin,
+        }
+
+    def link_finished(self):
+        if not self.done.done() and all(link.done.done() for link in self.links):
+            self.done.set_result([link.done.result() for link in self.links])
+
+    def finish(self, results=()):
+        if not self.done.done():
+            self.done.set_result(list(results))
+
+class LinkJob:
+    def __init__(self, message_job, url):
+        self.message_job = message_job
+        self.guild = message_job.guild
+        self.url = url
+        self.key = None  # (guild id, canonical url)
+        self.fetched = None
+        self.title = None
+        self.link_text = None
+        self.summary = None
+        self.summary_input = None  # text sent to the LLM
+        self.thread_id = None  # curated thread for this link, once known
+        self.done = asyncio.get_running_loop().create_future()
+
+    def finish(self, result):
+        if not self.done.done():
+            self.done.set_result(result)
+            self.message_job.link_finished()
+
+class PipelineStage:
+    def __init__(self, name, handler, workers, queue_size):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue = asyncio.Queue(queue_size)
+        self.tasks = []
+        self.active = 0
+        self.processed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+        self.max_depth = 0
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "active": self.active,
+            "depth": self.queue.qsize(),
+            "max_depth": self.max_depth,
+            "processed": self.processed,
+            "failed": self.failed,
+            "avg_time": self.busy_time / self.processed if self.processed else 0.0,
+        }
+
+class LinkPipeline:
+    def __init__(self, handlers, config=PIPELINE_STAGES):
+        self.stages = {name: PipelineStage(name, handler, *config[name]) for name, handler in handlers.items()}
+        self.inflight = {}  # (guild id, canonical url) -> leading LinkJob
+        self.running = set()  # job queue ids currently in the pipeline
+        self.poller = None
+        self.started_at = time.monotonic()
+
+    def start(self):
+        self.started_at = time.monotonic()
+        for stage in self.stages.values():
+            stage.tasks = [asyncio.create_task(self.work(stage)) for _ in range(stage.workers)]
+        self.poller = asyncio.create_task(self.poll())
+
+    async def stop(self):
+        tasks = [task for stage in self.stages.values() for task in stage.tasks] + [self.poller]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def enqueue(self, message, origin='message'):
+        """Durably queue a message for link processing; returns its MessageJob without waiting for the result."""
+        job = MessageJob(message.guild, message.channel, message.id, message.content, origin)
+        job.queue_id = await job_queue.enqueue(job.payload())
+        await self.submit(job)
+        return job
+
+    async def submit(self, job):
+        self.running.add(job.queue_id)
+        job.done.add_done_callback(lambda _: spawn(self.complete(job)))
+        await self.put('extract', job)
+
+    async def poll(self):
+        """Feed the pipeline with retries and with jobs left unfinished by a previous run."""
+        await client.wait_until_ready()
+        renewed_at = time.monotonic()
+        while True:
+            if time.monotonic() - renewed_at >= JOB_LEASE_RENEW_INTERVAL:
+                job_queue.renew(self.running)
+                renewed_at = time.monotonic()
+            for queue_id, payload, attempts in job_queue.lease(exclude=self.running):
+                job = MessageJob.from_payload(payload, queue_id, attempts)
+                if job is None:
+                    job_queue.ack(queue_id)
+                else:
+                    await self.submit(job)
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    async def complete(self, job):
+        results = job.done.result()
+        try:
+            if ProcessLinkResult.FETCH_FAILED in results:
+                job_queue.nack(job.queue_id, "links failed: " + " ".join(
+                    link.url for link in job.links if link.done.result() is ProcessLinkResult.FETCH_FAILED
+                ))
+                return
+            if job.origin == 'organize' and results and all(result in CURATED_RESULTS for result in results):
+                # The source message goes only once its links are curated, and before the ack
+                try:
+                    await job.channel.get_partial_message(job.message_id).delete()
+                except discord.NotFound:
+                    pass
+                except discord.HTTPException as e:
+                    print(f"Could not delete organized message {job.message_id}: {e}")
+            job_queue.ack(job.queue_id)
+        finally:
+            self.running.discard(job.queue_id)
+
+    async def put(self, stage_name, job):
+        stage = self.stages[stage_name]
+        await stage.queue.put(job)  # blocks while the stage is full: backpressure
+        stage.max_depth = max(stage.max_depth, stage.queue.qsize())
+
+    async def work(self, stage):
+        while True:
+            job = await stage.queue.get()
+            stage.active += 1
+            started = time.monotonic()
+            next_stage = None
+            try:
+                next_stage = await stage.handler(job)
+            except Exception as e:
+                stage.failed += 1
+                print(f"Pipeline stage '{stage.name}' failed:", file=sys.stderr)
+                traceback.print_exception(type(e), e, e.__traceback__, file=sys.stderr)
+                # Missing permissions do not heal on retry; the job is acked and the user told
+                result = ProcessLinkResult.PERMISSION_ERROR if isinstance(e, discord.Forbidden) else ProcessLinkResult.FETCH_FAILED
+                job.finish([result] if isinstance(job, MessageJob) else result)
+            finally:
+                stage.active -= 1
+                stage.processed += 1
+                stage.busy_time += time.monotonic() - started
+                stage.queue.task_done()
+            if next_stage:
+                await self.put(next_stage, job)
+
+    def lead(self, job):
+        """Make job the in-flight leader for its key, or attach it to the current leader. True if it leads."""
+        leader = self.inflight.get(job.key)
+        if leader is not None:
+            def follow(done):
+                job.thread_id = leader.thread_id
+                job.finish(done.result())
+            leader.done.add_done_callback(follow)
+            return False
+        self.inflight[job.key] = job
+        job.done.add_done_callback(lambda _: self.inflight.pop(job.key, None))
+        return True
+
+    def stats(self):
+        return {name: stage.stats() for name, stage in self.stages.items()}
+
+
+def curated_links_channel(guild):
+    category = discord.utils.get(guild.categories, name='CURATED')
+    if category is None:
+        return None
+    return discord.utils.get(category.channels, name='links')
+
+# Persistent record of every link the bot has curated, so "already curated?" never needs Discord history
+class CuratedLinks:
+    def __init__(self, conn):
+        self.conn = conn
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS curated_links (guild_id INTEGER, url_hash INTEGER, url TEXT, title TEXT, "
+                "thread_id INTEGER, message_id INTEGER, created_at REAL, updated_at REAL, PRIMARY KEY (guild_id, url_hash))"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS curated_links_thread ON curated_links (thread_id)")
+            # Titles of other threads in the links channel found by the archive sweep; they still count for dedup
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS thread_titles (thread_id INTEGER PRIMARY KEY, guild_id INTEGER, title TEXT)"
+            )
+
+    def add(self, guild_id, url, title, thread_id, message_id, created_at=None):
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO curated_links VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (guild_id, url_hash) DO UPDATE SET "
+                "title = excluded.title, thread_id = excluded.thread_id, message_id = excluded.message_id, "
+                "updated_at = excluded.updated_at",
+                (guild_id, url_hash(url), url, title, thread_id, message_id, created_at or now, now),
+            )
+
+    def find(self, guild_id, url):
+        row = self.conn.execute(
+            "SELECT thread_id FROM curated_links WHERE guild_id = ? AND url_hash = ?", (guild_id, url_hash(url))
+        ).fetchone()
+        return row[0] if row else None
+
+    def for_guild(self, guild_id):
+        return self.conn.execute("SELECT url, title, thread_id FROM curated_links WHERE guild_id = ?", (guild_id,)).fetchall()
+
+    def add_title(self, guild_id, thread_id, title):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO thread_titles VALUES (?, ?, ?)", (thread_id, guild_id, title))
+
+    def titles(self, guild_id):
+        return self.conn.execute("SELECT thread_id, title FROM thread_titles WHERE guild_id = ?", (guild_id,)).fetchall()
+
+    def has_thread(self, thread_id):
+        return self.conn.execute(
+            "SELECT 1 FROM curated_links WHERE thread_id = ? UNION ALL SELECT 1 FROM thread_titles WHERE thread_id = ?",
+            (thread_id, thread_id),
+        ).fetchone() is not None
+
+    def rename(self, thread_id, title):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE curated_links SET title = ?, updated_at = ? WHERE thread_id = ?", (title, time.time(), thread_id)
+            )
+            self.conn.execute("UPDATE thread_titles SET title = ? WHERE thread_id = ?", (title, thread_id))
+
+    def remove_thread(self, thread_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM curated_links WHERE thread_id = ?", (thread_id,))
+            self.conn.execute("DELETE FROM thread_titles WHERE thread_id = ?", (thread_id,))
+
+    def retain(self, guild_id, thread_ids, table='curated_links'):
+        """Forget links (or titles) whose thread is gone; returns how many were dropped."""
+        stale = [
+            (thread_id,)
+            for (thread_id,) in self.conn.execute(f"SELECT DISTINCT thread_id FROM {table} WHERE guild_id = ?", (guild_id,))
+            if thread_id not in thread_ids
+        ]
+        with self.conn:
+            removed = self.conn.executemany(f"DELETE FROM {table} WHERE thread_id = ?", stale).rowcount
+        return removed
+
+curated_links = None
+
+# In-memory index of each guild's curated threads: built once per guild, then kept current from gateway events
+def normalize_title(title):
+    return ' '.join(title.casefold().split())
+
+class GuildLinkIndex:
+    def __init__(self, channel, links=(), titles=()):
+        self.channel = channel
+        self.by_url = {}  # url hash -> thread id
+        self.by_title = {}  # normalized title -> thread id
+        self.titles = {}  # thread id -> normalized title
+        self.urls = {}  # thread id -> url hashes
+        for url, title, thread_id in links:
+            self.add(thread_id, title, url)
+        for thread_id, title in titles:
+            self.rename(thread_id, title)
+        if channel is not None:
+            for thread in channel.threads:
+                self.add(thread.id, thread.name)
+
+    def add(self, thread_id, title, url=None):
+        self.rename(thread_id, title)
+        if url is not None:
+            key = url_hash(url)
+            self.by_url[key] = thread_id
+            self.urls.setdefault(thread_id, set()).add(key)
+
+    def rename(self, thread_id, title):
+        old = self.titles.get(thread_id)
+        if old is not None and self.by_title.get(old) == thread_id:
+            del self.by_title[old]
+        self.titles[thread_id] = normalize_title(title)
+        self.by_title[self.titles[thread_id]] = thread_id
+
+    def remove(self, thread_id):
+        title = self.titles.pop(thread_id, None)
+        if title is not None and self.by_title.get(title) == thread_id:
+            del self.by_title[title]
+        for key in self.urls.pop(thread_id, ()):
+            if self.by_url.get(key) == thread_id:
+                del self.by_url[key]
+
+    def find_url(self, url):
+        return self.by_url.get(url_hash(url))
+
+    def find_title(self, title):
+        return self.by_title.get(normalize_title(title))
+
+class LinkIndex:
+    def __init__(self):
+        self.guilds = {}
+
+    def get(self, guild):
+        index = self.guilds.get(guild.id)
+        # A guild without a links channel is re-resolved until organize creates one
+        if index is None or index.channel is None:
+            index = self.guilds[guild.id] = GuildLinkIndex(
+                curated_links_channel(guild), curated_links.for_guild(guild.id), curated_links.titles(guild.id)
+            )
+        return index
+
+    def for_thread(self, guild_id, parent_id):
+        index = self.guilds.get(guild_id)
+        if index is not None and index.channel is not None and index.channel.id == parent_id:
+            return index
+        return None
+
+    def invalidate(self, guild_id):
+        self.guilds.pop(guild_id, None)
+
+    def channel_changed(self, channel):
+        index = self.guilds.get(channel.guild.id)
+        if index is None:
+            return
+        if channel.name in ('CURATED', 'links') or (index.channel is not None and index.channel.id == channel.id):
+            self.invalidate(channel.guild.id)
+
+link_index = LinkIndex()
+
+async def index_thread(guild, thread):
+    """Record a curated thread from the bot's first message in it; returns its canonical URL, or None if it is not one of ours."""
+    async for message in thread.history(limit=1, oldest_first=True):
+        if message.author != client.user or not message.content:
+            return None
+        urls = extract_urls(message.content.splitlines()[-1]) or extract_urls(message.content)
+        if not urls:
+            return None
+        url = canonical_url(urls[-1])
+        created_at = discord.utils.snowflake_time(thread.id).timestamp()
+        curated_links.add(guild.id, url, thread.name, thread.id, message.id, created_at=created_at)
+        return url
+    return None
+
+async def reindex_links(guild):
+    """Rebuild the guild's curated links from its active and archived threads; returns (indexed, dropped)."""
+    links_channel = curated_links_channel(guild)
+    if links_channel is None:
+        return 0, 0
+    threads = list(links_channel.threads)
+    threads += [thread async for thread in links_channel.archived_threads(limit=None)]
+    indexed = set()
+    for thread in threads:
+        if await index_thread(guild, thread) is not None:
+            indexed.add(thread.id)
+        else:
+            curated_links.add_title(guild.id, thread.id, thread.name)
+    dropped = curated_links.retain(guild.id, indexed)
+    curated_links.retain(guild.id, {thread.id for thread in threads} - indexed, table='thread_titles')
+    link_index.invalidate(guild.id)
+    return len(indexed), dropped
+
+# Archived threads drop out of channel.threads after an hour, so sweep them into the link index in the
+# background: the whole archive once per guild, then only what was archived since the last sweep
+ARCHIVE_PAGE_SIZE = 100
+ARCHIVE_SWEEP_INTERVAL = 6 * 3600
+ARCHIVE_RATE_KEY = 'discord.archived_threads'
+
+class ArchiveSweeper:
+    def __init__(self, conn):
+        self.conn = conn
+        self.task = None
+        with self.conn:
+            # high_water: newest archive time covered by the last finished sweep; sweep_top/cursor: the sweep in progress
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS archive_sweeps "
+                "(guild_id INTEGER PRIMARY KEY, high_water REAL, sweep_top REAL, cursor REAL, swept_at REAL)"
+            )
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    def state(self, guild_id):
+        row = self.conn.execute(
+            "SELECT high_water, sweep_top, cursor FROM archive_sweeps WHERE guild_id = ?", (guild_id,)
+        ).fetchone()
+        return row or (None, None, None)
+
+    def save(self, guild_id, high_water, sweep_top, cursor):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO archive_sweeps VALUES (?, ?, ?, ?, ?)",
+                (guild_id, high_water, sweep_top, cursor, time.time()),
+            )
+
+    async def run(self):
+        await client.wait_until_ready()
+        while True:
+            for guild in client.guilds:
+                try:
+                    await self.sweep(guild)
+                except Exception as e:
+                    # Keep sweeping the other guilds, and this one again next round
+                    print(f"Archive sweep failed for {guild.name}: {e!r}")
+            await asyncio.sleep(ARCHIVE_SWEEP_INTERVAL)
+
+    async def sweep(self, guild):
+        index = link_index.get(guild)
+        if index.channel is None:
+            return
+        high_water, sweep_top, cursor = self.state(guild.id)
+        seen = indexed = 0
+        while True:
+            await rate_limiter.acquire(ARCHIVE_RATE_KEY)
+            before = datetime.datetime.fromtimestamp(cursor, datetime.timezone.utc) if cursor else None
+            page = [thread async for thread in index.channel.archived_threads(limit=ARCHIVE_PAGE_SIZE, before=before)]
+            caught_up = len(page) < ARCHIVE_PAGE_SIZE
+            for thread in page:
+                archived_at = thread.archive_timestamp.timestamp()
+                if high_water is not None and archived_at <= high_water:
+                    caught_up = True
+                    break
+                sweep_top = max(sweep_top or archived_at, archived_at)
+                cursor = archived_at
+                seen += 1
+                index.rename(thread.id, thread.name)
+                if not curated_links.has_thread(thread.id):
+                    await rate_limiter.acquire(ARCHIVE_RATE_KEY)
+                    url = await index_thread(guild, thread)
+                    if url is not None:
+                        index.add(thread.id, thread.name, url)
+                        indexed += 1
+                    else:
+                        curated_links.add_title(guild.id, thread.id, thread.name)
+            if caught_up:
+                break
+            self.save(guild.id, high_water, sweep_top, cursor)
+        self.save(guild.id, sweep_top or high_water, None, None)
+        if seen:
+            print(f"Swept {seen} archived threads in {guild.name}, {indexed} newly indexed")
+
+archive_sweeper = None
+
+def thread_url(guild_id, thread_id):
+    # Works for archived threads too, which are not in the client cache
+    return f"https://discord.com/channels/{guild_id}/{thread_id}"
+
+async def report_results(job):
+    await job.done
+    known = [
+        thread_url(job.guild.id, link.thread_id) for link in job.links
+        if link.thread_id is not None and link.done.result() in (ProcessLinkResult.ALREADY_EXISTS, ProcessLinkResult.THREAD_EXISTS)
+    ]
+    if known:
+        await job.channel.send("Already curated here: " + " ".join(known))
+    failed = [link.url for link in job.links if link.done.result() is ProcessLinkResult.FETCH_FAILED]
+    if failed:
+        await job.channel.send("Could not fetch link info, please try again later: " + " ".join(f"<{url}>" for url in failed))
+    missing = [link.url for link in job.links if link.done.result() is ProcessLinkResult.NOT_FOUND]
+    if missing:
+        await job.channel.send("These links do not exist or are no longer available, not curating them: " + " ".join(f"<{url}>" for url in missing))
+
+async def extract_stage(job):
+    urls = extract_urls(job.content)
+    if not urls:
+        job.finish()
+        return None
+    # Retries run silently; the poster already got a reply on the first attempt
+    notify = job.origin == 'message' and job.attempts == 1
+    if notify:
+        await job.channel.send("Fetching link info...")
+    if link_index.get(job.guild).channel is None:
+        if notify:
+            await job.channel.send("The 'CURATED' category or its 'links' channel does not exist.")
+        job.finish([ProcessLinkResult.PERMISSION_ERROR] * len(urls))
+        return None
+    job.links = [LinkJob(job, url) for url in urls]
+    if notify:
+        spawn(report_results(job))
+    for link in job.links:
+        await link_pipeline.put('canonicalize', link)
+    return None
+
+async def canonicalize_stage(job):
+    job.url = await redirect_resolver.resolve(job.url)
+    job.key = (job.guild.id, canonical_url(job.url))
+    return 'dedup'
+
+async def dedup_stage(job):
+    # Identical links already in flight for this guild share the leader's result
+    if not link_pipeline.lead(job):
+        return None
+    # Known links stop here, before any fetch or LLM call
+    index = link_index.get(job.guild)
+    cached = metadata_cache.get(job.key[1])
+    job.thread_id = index.find_url(job.key[1])
+    if job.thread_id is not None:
+        if REFRESH_KNOWN_LINKS and not (cached and cached.fresh):
+            spawn(refresh_metadata(job.url, job.key[1]))
+        job.finish(ProcessLinkResult.ALREADY_EXISTS)
+        return None
+    # Untitled links say nothing about each other; only their URLs can match
+    if cached and cached.title != UNTITLED:
+        job.thread_id = index.find_title(cached.title)
+    if job.thread_id is not None:
+        job.finish(ProcessLinkResult.THREAD_EXISTS)
+        return None
+    return 'fetch'
+
+async def refresh_metadata(url, canonical):
+    """Revalidate a known link's cached metadata in the background; changes that would need the LLM are left alone."""
+    fetched = await fetch_flights.run(canonical, fetch_link, url)
+    if fetched is None or fetched.from_cache or fetched.tweet is not None or not fetched.summary:
+        return
+    metadata_cache.put(
+        canonical, (fetched.title or UNTITLED)[:100], fetched.link_text, fetched.summary,
+        etag=fetched.etag, last_modified=fetched.last_modified, ttl=fetched.ttl,
     )
-    summary = response.choices[0].text.strip()
-    return summary
- 
-
-
-async def process_link(message):
-    # Fetch webpage
-    link_title, link_text, summary = await fetch_webpage(message.content)
-    # Summarize the article with GPT-3.5
-    category = discord.utils.get(message.guild.categories, name='CURATED')
-    links_channel = discord.utils.get(category.channels, name='links')
-    if links_channel:
-      existing_threads = [thread for thread in links_channel.threads if thread.name == link_title]
-      if not existing_threads:
-          existing_links = [link async for link in links_channel.history() if link.author == client.user and link.content.startswith(link_title)]
-          await asyncio.sleep(1)  # Delay to respect rate limits
-          if not existing_links:
-              thread = await links_channel.create_thread(name=link_title, auto_archive_duration=60)
-              # Send the summary and metadata to the thread
-              await thread.send(f"{link_title} - {link_text}\n{summary}\n{message.content}")
-                
+
+async def fetch_stage(job):
+    job.fetched = await fetch_flights.run(job.key[1], fetch_link, job.url)
+    if job.fetched is None:
+        job.finish(ProcessLinkResult.FETCH_FAILED)
+        return None
+    if job.fetched.gone:
+        job.finish(ProcessLinkResult.NOT_FOUND)
+        return None
+    return 'parse'
+
+async def parse_stage(job):
+    fetched = job.fetched
+    if fetched.tweet is not None:
+        job.link_text = format_metadata(fetched.tweet)
+        # Only the tweet text goes to the LLM, so reshares of the same text hit the LLM cache
+        job.summary_input = fetched.tweet.get('text') or job.link_text
+        return 'summarize'
+    job.title, job.link_text, job.summary = fetched.title, fetched.link_text, fetched.summary
+    if not job.summary and fetched.content:
+        job.summary_input = fetched.content
+        return 'summarize'
+    job.summary = job.summary or 'No description available.'
+    finish_metadata(job)
+    return 'publish'
+
+async def summarize_stage(job):
+    summarizer = choose_summarizer(job.guild.id, job.key[1], job.summary_input)
+    summarizer_counts[summarizer] += 1
+    if summarizer == 'local':
+        apply_summary(job, local_summary(job.summary_input))
+        return 'publish'
+    if job.message_job.origin == 'organize':
+        # Backfill: wait for a batch off the worker pool, so the pool keeps filling the batch
+        await batch_summarizer.reserve()
+        spawn(summarize_in_batch(job))
+        return None
+    try:
+        result = await asyncio.wait_for(summarize_link(job.summary_input), LLM_LATENCY_SLO)
+    except (LLMError, asyncio.TimeoutError) as e:
+        result = fallback_summary(job.url, job.summary_input, e)
+    apply_summary(job, result)
+    return 'publish'
+
+async def summarize_in_batch(job):
+    try:
+        result = await batch_summarizer.summarize(job.summary_input)
+    except Exception as e:
+        result = fallback_summary(job.url, job.summary_input, e)
+    apply_summary(job, result)
+    await link_pipeline.put('publish', job)
+
+def apply_summary(job, result):
+    # A page's own title beats a generated one
+    job.title, job.summary = job.title or result.title, result.summary or 'No summary available.'
+    if result.tags:
+        job.link_text += f"tags: {', '.join(result.tags)}\n"
+    finish_metadata(job)
+
+def finish_metadata(job):
+    if not job.title:
+        job.title = UNTITLED
+    if len(job.title) > 100:
+        job.title = job.title[:100]
+    fetched = job.fetched
+    if not fetched.from_cache:
+        metadata_cache.put(
+            job.key[1], job.title, job.link_text, job.summary,
+            etag=fetched.etag, last_modified=fetched.last_modified, ttl=fetched.ttl,
+        )
+
+# Discord rejects longer messages; the URL on the last line is always kept
+DISCORD_MESSAGE_LIMIT = 2000
+
+def thread_message(job):
+    body = f"{job.title} - {job.link_text}\n{job.summary}"
+    url = f"\n{job.url}"
+    room = DISCORD_MESSAGE_LIMIT - len(url)
+    if len(body) > room:
+        body = body[:room - 1] + '…'
+    return body + url
+
+async def publish_stage(job):
+    index = link_index.get(job.guild)
+    links_channel = index.channel
+    if not links_channel:
+        job.finish(ProcessLinkResult.PERMISSION_ERROR)
+        return None
+    # Same-URL jobs are already deduplicated by lead(); different URLs can still resolve to one title
+    async with thread_locks.hold((job.guild.id, normalize_title(job.title))):
+        if job.title != UNTITLED:
+            job.thread_id = index.find_title(job.title)
+        if job.thread_id is not None:
+            job.finish(ProcessLinkResult.THREAD_EXISTS)
+            return None
+        thread = await links_channel.create_thread(name=job.title, auto_archive_duration=60)
+        # Send the summary and metadata to the thread; a thread without them is not a curated link
+        try:
+            message = await thread.send(thread_message(job))
+        except discord.HTTPException:
+            with contextlib.suppress(discord.HTTPException):
+                await thread.delete()
+            raise
+        index.add(thread.id, thread.name, job.key[1])
+        job.thread_id = thread.id
+        curated_links.add(job.guild.id, job.key[1], thread.name, thread.id, message.id)
+    job.finish(ProcessLinkResult.ADDED)
+    return None
+
+link_pipeline = None
+
 
 
 
 ######
-client = commands.Bot(command_prefix="!", intents=intents)
+class LinkCuratorBot(commands.Bot):
+    async def setup_hook(self):
+        global http_session, db, metadata_cache, redirect_resolver, llm_cache, batch_summarizer, summarizer_settings, curated_links, archive_sweeper, job_queue, link_pipeline
+        db = open_database()
+        metadata_cache = MetadataCache(db)
+        llm_cache = LLMCache(db)
+        batch_summarizer = BatchSummarizer()
+        summarizer_settings = SummarizerSettings(db)
+        redirect_resolver = RedirectResolver(db)
+        curated_links = CuratedLinks(db)
+        archive_sweeper = ArchiveSweeper(db)
+        job_queue = JobQueue(db)
+        recovered = job_queue.recover()
+        if recovered:
+            print(f"Resuming {recovered} unfinished link jobs")
+        http_session = create_http_session()
+        await warm_up_connections(http_session)
+        link_pipeline = LinkPipeline({
+            'extract': extract_stage,
+            'canonicalize': canonicalize_stage,
+            'dedup': dedup_stage,
+            'fetch': fetch_stage,
+            'parse': parse_stage,
+            'summarize': summarize_stage,
+            'publish': publish_stage,
+        })
+        link_pipeline.start()
+        archive_sweeper.start()
+
+    async def close(self):
+        await super().close()
+        if link_pipeline is not None:
+            await link_pipeline.stop()
+        if archive_sweeper is not None:
+            await archive_sweeper.stop()
+        if job_queue is not None:
+            job_queue.flush()
+        if http_session is not None and not http_session.closed:
+            await http_session.close()
+        if db is not None:
+            db.close()
+
+
+client = LinkCuratorBot(command_prefix="!", intents=intents)
 
 @client.event
 async def on_ready():
@@ -207,17 +2668,54 @@ async def on_command_error(ctx: commands.Context, error):
         traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
 client.on_command_error = on_command_error
 
+# Keep the curated thread index current
+@client.event
+async def on_thread_create(thread):
+    index = link_index.for_thread(thread.guild.id, thread.parent_id)
+    if index is not None:
+        index.add(thread.id, thread.name)
+
+@client.event
+async def on_thread_update(before, after):
+    if before.name == after.name:
+        return
+    index = link_index.for_thread(after.guild.id, after.parent_id)
+    if index is not None:
+        index.rename(after.id, after.name)
+    curated_links.rename(after.id, after.name)
+
+@client.event
+async def on_raw_thread_delete(payload):
+    index = link_index.for_thread(payload.guild_id, payload.parent_id)
+    if index is not None:
+        index.remove(payload.thread_id)
+    curated_links.remove_thread(payload.thread_id)
+
+# CURATED or links renamed, moved, created or deleted: resolve the channel again on next use
+@client.event
+async def on_guild_channel_create(channel):
+    link_index.channel_changed(channel)
+
+@client.event
+async def on_guild_channel_delete(channel):
+    link_index.channel_changed(channel)
+
+@client.event
+async def on_guild_channel_update(before, after):
+    if before.name != after.name or getattr(before, 'category_id', None) != getattr(after, 'category_id', None):
+        link_index.channel_changed(before)
+        link_index.channel_changed(after)
+
+@client.event
+async def on_guild_remove(guild):
+    link_index.invalidate(guild.id)
+
 # trigger for new links
 @client.event
 async def on_message(message):
-    if message.content.startswith('http'):
-        await message.channel.send("Fetching link info...")
-
-        category = discord.utils.get(message.guild.categories, name='CURATED')
-        if category:
-            await process_link(message)
-        else:
-            await message.channel.send("The 'CURATED' category does not exist.")
+    # Only queue the message here; fetching, summarizing and replying happen in the pipeline
+    if not message.author.bot and message.guild and 'http' in message.content:
+        await link_pipeline.enqueue(message)
 
     # Process commands
     await client.process_commands(message)
@@ -225,6 +2723,17 @@ async def on_message(message):
 
 
 
+async def finish_organized(ctx, job):
+    # The pipeline deletes the source message itself once its links are curated
+    results = await job.done
+    if ProcessLinkResult.NOT_FOUND in results:
+        await ctx.send(f"Link no longer exists, keeping it: {job.content}")
+        return
+    if not results or not all(result in CURATED_RESULTS for result in results):
+        await ctx.send(f"Could not fetch link, keeping it: {job.content}")
+        return
+    await ctx.send(f"Processed link: {job.content}")
+
 @client.command(name='organize')
 @commands.has_any_role('Admin', 'Manager')
 async def organize(ctx):
@@ -253,86 +2762,236 @@ async def organize(ctx):
                 await ctx.send(f"Processing channel '{channel.name}'...")
 
                 before_message = None  # Initialize the before_message variable
+                pending = []
                 async for message in channel.history(limit=None, before=before_message):
-                    if message.content.startswith('http'):
-                        await process_link(message)
-                        await ctx.send(f"Processed link: {message.content}")
-                        await message.delete()
+                    if extract_urls(message.content):
+                        job = await link_pipeline.enqueue(message, origin='organize')
+                        pending.append(finish_organized(ctx, job))
+                await asyncio.gather(*pending)
 
     await ctx.send("Organize completed!")
 
 
+@client.command(name='reindex')
+@commands.has_any_role('Admin', 'Manager')
+@commands.cooldown(1, 300, commands.BucketType.guild)
+async def reindex(ctx):
+    await ctx.send("Rebuilding the curated link index from Discord...")
+    indexed, dropped = await reindex_links(ctx.guild)
+    await ctx.send(f"Link index rebuilt: {indexed} curated threads indexed, {dropped} stale entries dropped.")
+
+
+# Bulk deletion: up to 100 messages per call, but only for messages younger than 14 days.
+# Older ones are deleted one at a time, paced by a token bucket; one status message shows progress.
+BULK_DELETE_SIZE = 100
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14, minutes=-5)  # margin for clock skew and slow batches
+SINGLE_DELETE_RATE_KEY = 'discord.message_delete'
+PROGRESS_UPDATE_INTERVAL = 5.0
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds}s"
+
+class DeletionProgress:
+    def __init__(self, status, action):
+        self.status = status
+        self.action = action
+        self.updated = time.monotonic()
+
+    async def report(self, text, final=False):
+        # Editing the status message is a REST call too, so keep it to one every few seconds
+        if not final and time.monotonic() - self.updated < PROGRESS_UPDATE_INTERVAL:
+            return
+        self.updated = time.monotonic()
+        await self.status.edit(content=f"{self.action}: {text}")
+
+async def delete_messages(channel, messages, progress):
+    """Delete messages in bulk where Discord allows it and singly otherwise; returns how many were deleted."""
+    cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+    recent = [message for message in messages if message.created_at > cutoff]
+    old = [message for message in messages if message.created_at <= cutoff]
+    single_rate = rate_limiter.bucket(SINGLE_DELETE_RATE_KEY).rate
+    total = len(messages)
+    deleted = 0
+    bulk_time = 0.0
+    bulk_calls = 0
+
+    def eta():
+        per_call = bulk_time / bulk_calls if bulk_calls else 1.0
+        return -(-len(recent) // BULK_DELETE_SIZE) * per_call + len(old) / single_rate
+
+    async def report():
+        await progress.report(f"{deleted}/{total} deleted, about {format_duration(eta())} left")
+
+    while recent:
+        chunk, recent = recent[:BULK_DELETE_SIZE], recent[BULK_DELETE_SIZE:]
+        # A long run can age messages past the bulk window while they wait
+        cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+        old += [message for message in chunk if message.created_at <= cutoff]
+        chunk = [message for message in chunk if message.created_at > cutoff]
+        if not chunk:
+            continue
+        started = time.monotonic()
+        try:
+            await channel.delete_messages(chunk)
+            deleted += len(chunk)
+        except discord.HTTPException as e:
+            # One bad message fails the whole batch; retry these singly
+            print(f"Bulk delete failed in {channel.name}, deleting singly: {e}")
+            old += chunk
+        bulk_time += time.monotonic() - started
+        bulk_calls += 1
+        await report()
+    while old:
+        message = old.pop(0)
+        await rate_limiter.acquire(SINGLE_DELETE_RATE_KEY)
+        try:
+            await message.delete()
+            deleted += 1
+        except discord.NotFound:
+            pass
+        await report()
+    return deleted
+
 
 @client.command(name='removedupes')
 @commands.cooldown(1, 10, commands.BucketType.guild)
 async def removedupes(ctx):
-    await ctx.send("Removing duplicate links...")
+    status = await ctx.send("Removing duplicate links...")
+    progress = DeletionProgress(status, "Removing duplicate links")
 
+    unique_messages = set()
+    encountered_links = set()
     message_history = []
-    async for message in ctx.channel.history(limit=None):
+    async for message in ctx.channel.history(limit=None, before=status):
         message_history.append(message)
+        # Short links resolved earlier dedup against their destination; this never hits the network
+        links = {canonical_url(redirect_resolver.cached(url) or url) for url in extract_urls(message.content)}
+        if links and not links <= encountered_links:
+            unique_messages.add(message.id)
+            encountered_links |= links
+        await progress.report(f"scanned {len(message_history)} messages")
 
-    unique_messages = []
-    encountered_links = set()
-    
-    for message in message_history:
-        if message.content.startswith('http') and message.content not in encountered_links:
-            unique_messages.append(message)
-            encountered_links.add(message.content)
-
-    deleted_count = 0
-    for message in message_history:
-        if message not in unique_messages:
-            await message.delete()
-            deleted_count += 1
-            await asyncio.sleep(1)  # Add a small delay after deleting a message to avoid rate limits
-
-    await ctx.send(f"Duplicate links removed! Total messages deleted: {deleted_count}")
-
-
-
-
-
-
+    duplicates = [message for message in message_history if message.id not in unique_messages]
+    deleted_count = await delete_messages(ctx.channel, duplicates, progress)
+    await progress.report(f"done! Total messages deleted: {deleted_count}", final=True)
 
 
 @client.command(name='removetext')
 async def removetext(ctx):
-    await ctx.send("Removing text messages...")
+    status = await ctx.send("Removing text messages...")
+    progress = DeletionProgress(status, "Removing text messages")
 
-    # Fetch the current channel
-    channel = ctx.channel
-
-    # Initialize variables
+    scanned = 0
     messages = []
-    before_message = None
-
-    # Fetch messages in chunks with rate limit handling
-    async for message in channel.history(limit=None, before=before_message):
-        messages.append(message)
-        before_message = message.created_at
-
-        # Rate limit handling
-        if len(messages) >= 100:
-            for message in messages:
-                if message.content and not message.embeds:
-                    await message.delete()
-                    await asyncio.sleep(2)  # Add a 2-second delay
+    async for message in ctx.channel.history(limit=None, before=status):
+        scanned += 1
+        if message.content and not message.embeds:
+            messages.append(message)
+        await progress.report(f"scanned {scanned} messages, {len(messages)} to delete")
+
+    deleted_count = await delete_messages(ctx.channel, messages, progress)
+    await progress.report(f"done! Total messages deleted: {deleted_count}", final=True)
+
+
+@client.command(name='ratelimits')
+async def ratelimits(ctx):
+    stats = rate_limiter.stats()
+    if not stats:
+        await ctx.send("No rate-limited requests yet.")
+        return
+    lines = [
+        f"{key}: {s['acquired']} requests, {s['waits']} throttled, "
+        f"{s['total_wait']:.1f}s total wait, {s['max_wait']:.1f}s max wait"
+        for key, s in sorted(stats.items(), key=lambda item: item[1]['total_wait'], reverse=True)[:20]
+    ]
+    await ctx.send("\n".join(lines))
+
+
+@client.command(name='circuits')
+async def circuits(ctx):
+    negative_cache.prune()
+    unhealthy = circuit_breakers.unhealthy()
+    lines = [
+        f"{domain}: {breaker.state.name.lower()}, {breaker.failures} failures, retry in {breaker.retry_in:.0f}s"
+        for domain, breaker in sorted(unhealthy.items())[:20]
+    ]
+    lines.append(f"{len(negative_cache.entries)} recently failed URLs in the negative cache.")
+    if not unhealthy:
+        lines.insert(0, "All domains healthy.")
+    await ctx.send("\n".join(lines))
+
+
+@client.command(name='pipeline')
+async def pipeline(ctx):
+    uptime = max(time.monotonic() - link_pipeline.started_at, 1.0)
+    lines = [
+        f"{name}: {s['active']}/{s['workers']} busy, queue {s['depth']} (max {s['max_depth']}), "
+        f"{s['processed']} done ({s['processed'] / uptime * 60:.1f}/min), {s['failed']} failed, {s['avg_time']:.2f}s avg"
+        for name, s in link_pipeline.stats().items()
+    ]
+    await ctx.send("\n".join(lines))
+
+
+@client.command(name='jobs')
+async def jobs(ctx):
+    stats = job_queue.stats()
+    await ctx.send(
+        f"Link jobs: {stats.get('pending', 0)} pending, {stats.get('leased', 0)} in progress, "
+        f"{stats['dead']} dead-lettered, {stats['unflushed']} unflushed writes."
+    )
 
-            messages = []  # Clear the list
 
-    # Delete any remaining messages
-    for message in messages:
-        if message.content and not message.embeds:
-            await message.delete()
-            await asyncio.sleep(2)  # Add a 2-second delay
+@client.command(name='llmcache')
+async def llmcache(ctx):
+    await ctx.send(
+        f"LLM cache: {llm_cache.hits} hits, {llm_cache.misses} misses ({llm_cache.hit_ratio:.0%} hit ratio), "
+        f"{format_size(llm_cache.total_bytes)} of {format_size(llm_cache.max_bytes)} used."
+    )
 
-    await ctx.send("Text messages removed!")
 
+@client.command(name='batches')
+async def batches(ctx):
+    b = batch_summarizer
+    await ctx.send(
+        f"Backfill batches: {b.batches} sent with {b.items} summaries, "
+        f"{b.prompt_tokens} prompt and {b.completion_tokens} completion tokens, {len(b.pending)} waiting."
+    )
 
 
+@client.command(name='llmlimits')
+async def llmlimits(ctx):
+    s = llm_limiter.stats()
+    paused = f", paused for {s['paused_for']:.0f}s" if s['paused_for'] else ""
+    await ctx.send(
+        f"LLM concurrency: limit {s['limit']:.1f}, {s['in_flight']} in flight, {s['waiting']} waiting{paused}. "
+        f"{s['requests']} requests ({s['avg_latency']:.1f}s avg), {s['throttled']} throttled, {s['retries']} retries."
+    )
 
 
+@client.command(name='summarizer')
+@commands.has_any_role('Admin', 'Manager')
+async def summarizer(ctx, mode=None, domain=''):
+    if mode is not None:
+        if mode not in SUMMARIZER_MODES:
+            await ctx.send(f"Unknown summarizer '{mode}'. Choose one of: {', '.join(SUMMARIZER_MODES)}.")
+            return
+        domain = domain.lower()
+        domain = domain[4:] if domain.startswith('www.') else domain
+        summarizer_settings.set(ctx.guild.id, mode, domain)
+        await ctx.send(f"Summarizer for {domain or 'this server'} set to {mode}.")
+        return
+    lines = [f"Summarizer for this server: {summarizer_settings.mode(ctx.guild.id)}"]
+    lines += [f"{domain}: {mode}" for domain, mode in summarizer_settings.for_guild(ctx.guild.id) if domain]
+    lines.append(
+        f"{summarizer_counts['local']} local and {summarizer_counts['llm']} LLM summaries, "
+        f"{summarizer_counts['fallback']} LLM fallbacks."
+    )
+    await ctx.send("\n".join(lines))
 
 
 # Test command
@@ -340,8 +2999,9 @@ async def removetext(ctx):
 async def test(ctx):
     await ctx.send("Test command received! The bot is working properly.")
 
-try:
-    client.run(os.getenv('LINKCURATOR_TOKEN'))
-except KeyboardInterrupt:
-    print("Keyboard interrupt detected. Stopping the bot...")
-    client.close()
+if __name__ == "__main__":
+    try:
+        client.run(os.getenv('LINKCURATOR_TOKEN'))
+    except KeyboardInterrupt:
+        print("Keyboard interrupt detected. Stopping the bot...")
+        client.close()
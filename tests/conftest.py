@@ -0,0 +1,9 @@
+import os
+import sys
+
+# main.py checks these at import time; the tests never talk to Discord, OpenAI or Twitter
+for name in ('OPENAI_API_KEY', 'LINKCURATOR_TOKEN', 'TWITTER_BEARER_TOKEN'):
+    os.environ.setdefault(name, 'test')
+os.environ.setdefault('LINKCURATOR_DB', ':memory:')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,16 @@
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://mobile.de/cars", "https://mobile.de/cars"),
+    ("https://amp.dev/documentation", "https://amp.dev/documentation"),
+    ("https://m.me/page", "https://m.me/page"),
+    ("https://www.mobile.de/cars", "https://mobile.de/cars"),
+    ("https://www.m.example.com/a", "https://example.com/a"),
+    ("http://www.example.com/a/?utm_source=x", "https://example.com/a"),
+    ("https://mobile.twitter.com/user/status/1", "https://twitter.com/user/status/1"),
+])
+def test_subdomains_are_stripped_only_above_the_registrable_domain(url, expected):
+    assert main.URLCanonicalizer().canonicalize(url) == expected
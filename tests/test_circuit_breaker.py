@@ -0,0 +1,42 @@
+import main
+
+
+def half_open_breaker():
+    breaker = main.CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    return breaker
+
+
+def test_half_open_admits_one_probe():
+    breaker = half_open_breaker()
+    probe = breaker.allow()
+    assert probe
+    assert breaker.state is main.CircuitState.HALF_OPEN
+    assert not breaker.allow()
+    breaker.release(probe)
+    assert breaker.allow()
+
+
+def test_request_from_closed_state_does_not_free_the_probe_slot():
+    breaker = main.CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    old_request = breaker.allow()
+    breaker.record_failure()
+    probe = breaker.allow()
+    assert probe
+    # A request admitted while closed finishes during the probe
+    breaker.release(old_request)
+    assert not breaker.allow()
+    breaker.release(probe)
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_with_longer_timeout():
+    breaker = main.CircuitBreaker(failure_threshold=1, reset_timeout=1, max_reset_timeout=10)
+    breaker.record_failure()
+    breaker.opened_at -= 1
+    probe = breaker.allow()
+    breaker.record_failure(probe)
+    breaker.release(probe)
+    assert breaker.state is main.CircuitState.OPEN
+    assert breaker.reset_timeout == 2
+    assert not breaker.allow()
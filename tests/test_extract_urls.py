@@ -0,0 +1,14 @@
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("see `https://example.com/a` here", ["https://example.com/a"]),
+    ("`https://example.com/a`,`https://example.org/b`", ["https://example.com/a", "https://example.org/b"]),
+    ("```\nhttps://example.com/a\n```", ["https://example.com/a"]),
+    ("(https://example.com/wiki/Foo_(bar)).", ["https://example.com/wiki/Foo_(bar)"]),
+    ("[docs](https://example.com/docs) and <https://example.org/>", ["https://example.com/docs", "https://example.org/"]),
+])
+def test_urls_are_extracted_without_surrounding_markup(text, expected):
+    assert main.extract_urls(text) == expected
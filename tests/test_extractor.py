@@ -0,0 +1,54 @@
+import main
+
+ARTICLE = "The long article text goes on for a while, with plenty of words to make it a real paragraph."
+
+
+def blocks(body):
+    html = f"<html><head><title>Page</title></head><body>{body}</body></html>"
+    return [text for text, _ in main.extract_metadata(html).blocks]
+
+
+def test_head_metadata():
+    metadata = main.extract_metadata(
+        '<html><head><title> A  title </title><meta name="description" content="Desc">'
+        '<meta property="og:site_name" content="Site"><link rel="canonical" href="https://example.com/a">'
+        '<script type="application/ld+json">{"@type": "NewsArticle", "headline": "Headline"}</script>'
+        '</head><body></body></html>'
+    )
+    assert metadata.title == "A title"
+    assert metadata.description == "Desc"
+    assert metadata.og == {"site_name": "Site"}
+    assert metadata.canonical_url == "https://example.com/a"
+    assert metadata.jsonld_headline == "Headline"
+
+
+def test_boilerplate_tags_are_skipped():
+    assert blocks(f"<nav><p>Home About</p></nav><p>{ARTICLE}</p><footer>Copyright</footer>") == [ARTICLE]
+
+
+def test_unclosed_paragraph_ends_skip():
+    assert blocks(f'<p class="share">Share this<p>{ARTICLE}</p>') == [ARTICLE]
+
+
+def test_unclosed_list_item_ends_skip():
+    body = f'<ul><li class="share">Share on <a href="#">X</a><li>Item two</ul><p>{ARTICLE}</p>'
+    assert blocks(body) == ["Item two", ARTICLE]
+
+
+def test_ancestor_end_tag_ends_skip():
+    body = f'<div><div class="social"><span>Like us</div><p>{ARTICLE}</p></div>'
+    assert blocks(body) == [ARTICLE]
+
+
+def test_boilerplate_classes_match_whole_tokens():
+    body = f'<div id="page" class="site has-sidebar"><article><p>{ARTICLE}</p></article></div>'
+    assert blocks(body) == [ARTICLE]
+
+
+def test_boilerplate_class_with_suffix_is_skipped():
+    assert blocks(f'<div class="share-buttons">Tweet Share</div><p>{ARTICLE}</p>') == [ARTICLE]
+
+
+def test_link_text_is_counted():
+    metadata = main.extract_metadata('<html><body><p>Read <a href="/x">this link</a> now</p></body></html>')
+    assert metadata.blocks == [("Read this link now", len("this link"))]
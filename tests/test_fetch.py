@@ -0,0 +1,41 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import main
+
+
+def fetch(monkeypatch, status):
+    async def handler(request):
+        return web.Response(status=status, text="error page")
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/page', handler)
+        server = TestServer(app)
+        await server.start_server()
+        session = aiohttp.ClientSession()
+        monkeypatch.setattr(main, 'http_session', session)
+        monkeypatch.setattr(main, 'metadata_cache', main.MetadataCache(main.open_database(':memory:')))
+        monkeypatch.setattr(main, 'negative_cache', main.NegativeCache())
+        monkeypatch.setattr(main, 'circuit_breakers', main.CircuitBreakers())
+        try:
+            return await main.fetch_link(str(server.make_url('/page')))
+        finally:
+            await session.close()
+            await server.close()
+
+    return asyncio.run(run())
+
+
+def test_missing_page_is_gone(monkeypatch):
+    assert fetch(monkeypatch, 404).gone
+    assert fetch(monkeypatch, 410).gone
+
+
+def test_temporary_failures_are_retried(monkeypatch):
+    assert fetch(monkeypatch, 503) is None
+    assert fetch(monkeypatch, 429) is None
+    assert fetch(monkeypatch, 403) is None
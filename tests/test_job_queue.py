@@ -0,0 +1,27 @@
+import asyncio
+
+import main
+
+
+def expired_queue(count):
+    async def enqueue():
+        queue = main.JobQueue(main.open_database(':memory:'))
+        ids = [await queue.enqueue({"n": n}) for n in range(count)]
+        return queue, ids
+
+    queue, ids = asyncio.run(enqueue())
+    with queue.conn:
+        queue.conn.execute("UPDATE jobs SET lease_until = 0")
+    return queue, ids
+
+
+def test_lease_skips_running_jobs_in_sql():
+    queue, ids = expired_queue(5)
+    leased = queue.lease(limit=2, exclude=set(ids[:3]))
+    assert [job_id for job_id, _, _ in leased] == ids[3:]
+
+
+def test_renewed_leases_are_not_leased_again():
+    queue, ids = expired_queue(3)
+    queue.renew(ids[:2])
+    assert [job_id for job_id, _, _ in queue.lease()] == ids[2:]
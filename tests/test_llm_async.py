@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import main
+
+SUMMARIES = 50
+STUB_LATENCY = 0.2
+TICK = 0.01
+MAX_LOOP_LAG = 0.1
+
+
+def completion(prompt):
+    return {
+        "choices": [{"index": 0, "text": '{"title": "Stub title", "summary": "Stub summary.", "tags": ["stub"]}'}],
+        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 20, "total_tokens": len(prompt) // 4 + 20},
+    }
+
+
+async def run_against(monkeypatch, handler, scenario):
+    app = web.Application()
+    app.router.add_post('/v1/completions', handler)
+    server = TestServer(app)
+    await server.start_server()
+    session = aiohttp.ClientSession()
+    monkeypatch.setattr(main, 'OPENAI_COMPLETIONS_URL', str(server.make_url('/v1/completions')))
+    monkeypatch.setattr(main, 'http_session', session)
+    monkeypatch.setattr(main, 'llm_cache', main.LLMCache(main.open_database(':memory:')))
+    monkeypatch.setattr(main, 'llm_limiter', main.AdaptiveLimiter())
+    try:
+        return await scenario()
+    finally:
+        await session.close()
+        await server.close()
+
+
+async def measure_lag(work):
+    """Run work while a ticker measures how late the event loop wakes it; returns (result, worst lag)."""
+    worst = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal worst
+        while not done:
+            started = time.monotonic()
+            await asyncio.sleep(TICK)
+            worst = max(worst, time.monotonic() - started - TICK)
+
+    task = asyncio.create_task(ticker())
+    try:
+        result = await work
+    finally:
+        done = True
+        await task
+    return result, worst
+
+
+def test_parallel_summaries_do_not_block_event_loop(monkeypatch):
+    requests_seen = 0
+
+    async def handler(request):
+        nonlocal requests_seen
+        requests_seen += 1
+        payload = await request.json()
+        await asyncio.sleep(STUB_LATENCY)
+        return web.json_response(completion(payload['prompt']))
+
+    async def scenario():
+        texts = [f"Article number {i}. It has some text worth summarizing." for i in range(SUMMARIES)]
+        return await measure_lag(asyncio.gather(*(main.summarize_link(text) for text in texts)))
+
+    results, lag = asyncio.run(run_against(monkeypatch, handler, scenario))
+    assert requests_seen == SUMMARIES
+    assert all(result.summary == "Stub summary." for result in results)
+    assert lag < MAX_LOOP_LAG
+
+
+def test_error_page_is_retried_as_llm_error(monkeypatch):
+    monkeypatch.setattr(main, 'LLM_BACKOFF_BASE', 0.01)
+    attempts = 0
+
+    async def handler(request):
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            return web.Response(status=502, text="<html><body>Bad gateway</body></html>", content_type='text/html')
+        return web.json_response(completion((await request.json())['prompt']))
+
+    async def scenario():
+        return await main.openai_completion("prompt")
+
+    body = asyncio.run(run_against(monkeypatch, handler, scenario))
+    assert attempts == 2
+    assert body['choices'][0]['text']
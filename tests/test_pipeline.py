@@ -0,0 +1,33 @@
+import asyncio
+from types import SimpleNamespace
+
+import discord
+
+import main
+
+
+def run_stage(error):
+    async def fail(job):
+        raise error
+
+    async def run():
+        pipeline = main.LinkPipeline({'publish': fail}, config={'publish': (1, 1)})
+        job = main.LinkJob(main.MessageJob(None, None, 1, ""), "https://example.com/")
+        job.message_job.links.append(job)
+        worker = asyncio.create_task(pipeline.work(pipeline.stages['publish']))
+        await pipeline.put('publish', job)
+        try:
+            return await asyncio.wait_for(job.done, 1)
+        finally:
+            worker.cancel()
+
+    return asyncio.run(run())
+
+
+def test_forbidden_is_a_permission_error():
+    response = SimpleNamespace(status=403, reason="Forbidden")
+    assert run_stage(discord.Forbidden(response, "Missing Access")) is main.ProcessLinkResult.PERMISSION_ERROR
+
+
+def test_other_errors_are_fetch_failures():
+    assert run_stage(RuntimeError("boom")) is main.ProcessLinkResult.FETCH_FAILED
@@ -0,0 +1,57 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import main
+
+
+async def with_resolver(monkeypatch, scenario):
+    async def hop(request):
+        target = {'/short': '/middle', '/middle': '/final', '/broken': '/slow'}.get(request.path)
+        if target:
+            raise web.HTTPFound(target)
+        if request.path == '/slow':
+            await asyncio.sleep(1)
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_route('*', '/{path}', hop)
+    server = TestServer(app)
+    await server.start_server()
+    session = aiohttp.ClientSession()
+    monkeypatch.setattr(main, 'http_session', session)
+    monkeypatch.setattr(main, 'REDIRECT_HOP_TIMEOUT', 0.2)
+    resolver = main.RedirectResolver(main.open_database(':memory:'), shortener_hosts={server.host})
+    try:
+        return await scenario(resolver, lambda path: str(server.make_url(path)))
+    finally:
+        await session.close()
+        await server.close()
+
+
+def test_complete_chain_is_cached(monkeypatch):
+    async def scenario(resolver, url):
+        return await resolver.resolve(url('/short')), resolver.cached(url('/short')), url('/final')
+
+    final_url, cached, expected = asyncio.run(with_resolver(monkeypatch, scenario))
+    assert final_url == cached == expected
+
+
+def test_interrupted_chain_is_not_cached(monkeypatch):
+    async def scenario(resolver, url):
+        return await resolver.resolve(url('/broken')), resolver.cached(url('/broken')), url('/slow')
+
+    final_url, cached, expected = asyncio.run(with_resolver(monkeypatch, scenario))
+    assert final_url == expected
+    assert cached is None
+
+
+def test_cached_destination_expires(monkeypatch):
+    async def scenario(resolver, url):
+        await resolver.resolve(url('/short'))
+        monkeypatch.setattr(main, 'REDIRECT_TTL', -1)
+        return resolver.cached(url('/short'))
+
+    assert asyncio.run(with_resolver(monkeypatch, scenario)) is None
@@ -0,0 +1,26 @@
+import main
+
+
+def test_ascii_words_count_about_four_characters_per_token():
+    assert main.count_tokens("hello world") == 4
+    assert main.count_tokens("a, b.") == 4
+
+
+def test_non_ascii_characters_count_one_token_each():
+    text = "今日は良い天気です"
+    assert main.count_tokens(text) == len(text)
+    assert main.count_tokens("привет") == 6
+
+
+def test_cjk_text_is_cut_to_budget():
+    text = "これは長い文章です。" * 500
+    fitted = main.fit_to_token_budget(text, budget=100)
+    assert main.count_tokens(fitted) <= 100
+    assert fitted
+
+
+def test_single_long_sentence_is_cut_to_budget():
+    text = "字" * 1000
+    fitted = main.fit_to_token_budget(text, budget=50)
+    assert main.count_tokens(fitted) <= 50
+    assert fitted